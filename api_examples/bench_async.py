@@ -0,0 +1,74 @@
+"""
+Compare the throughput of the sync and async read endpoints under concurrency.
+
+Run the project once under WSGI and once under ASGI, e.g.
+
+    gunicorn learnXpert.wsgi -w 4 --threads 8
+    uvicorn learnXpert.asgi:application --workers 4
+
+and point this script at each deployment. For every endpoint it fires
+``requests`` requests from ``concurrency`` threads and prints requests per
+second and latency percentiles.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ENDPOINTS = {
+    'subjects': ('subjects/', 'async/subjects/'),
+    'courses': ('courses/', 'async/courses/'),
+    'course': ('courses/{course}/', 'async/courses/{course}/'),
+    'contents': ('courses/{course}/contents/', 'async/courses/{course}/contents/'),
+}
+
+
+def run(url, total, concurrency, auth):
+    session = requests.Session()
+    session.auth = auth
+
+    def fetch(_):
+        start = time.perf_counter()
+        response = session.get(url)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    # warm up caches and stored snapshots before timing
+    fetch(None)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(fetch, range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        'rps': total / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[min(int(total * 0.99), total - 1)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000/api/')
+    parser.add_argument('--course', type=int, default=1)
+    parser.add_argument('--username', default='')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+    auth = (args.username, args.password) if args.username else None
+
+    print(f"{'endpoint':<10} {'view':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, paths in ENDPOINTS.items():
+        if name == 'contents' and auth is None:
+            continue
+        for kind, path in zip(('sync', 'async'), paths):
+            url = args.base_url + path.format(course=args.course)
+            # only the contents need credentials, hashing them would dominate the other timings
+            result = run(url, args.requests, args.concurrency, auth if name == 'contents' else None)
+            print(f"{name:<10} {kind:<6} {result['rps']:>8.1f} {result['p50']:>8.1f} {result['p99']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,29 @@ password = ''
 
 base_url = 'http://127.0.0.1:8000/api/'
 
-result = requests.get(f"{base_url}courses/")
-courses = result.json()
+# the course list is paginated, follow the next cursors
+courses = []
+url = f"{base_url}courses/"
+while url:
+    page = requests.get(url).json()
+    courses.extend(page['results'])
+    url = page['next']
 available_courses = ', '.join([course['title'] for course in courses])
 print(f"Available courses: {available_courses}")
 
-for course in courses:
-    course_id = course['id']
-    course_title = course['title']
-    r = requests.post(f"{base_url}courses/{course_id}/enroll/", auth=(username, password))
-    if r.status_code == 200:
-        print(f"Successfully enrolled in {course_title}")
+# exchange the password for a token once, the password is not hashed again
+# by the following requests
+token = requests.post(f"{base_url}token/", auth=(username, password)).json()['token']
+headers = {'Authorization': f"Bearer {token}"}
+
+# enroll in every course with a single request
+titles = {course['id']: course['title'] for course in courses}
+r = requests.post(
+    f"{base_url}courses/batch-enroll/",
+    json={'courses': list(titles)},
+    headers=headers
+)
+if r.status_code == 200:
+    for result in r.json()['results']:
+        if result['enrolled']:
+            print(f"Successfully enrolled in {titles[result['course']]}")
@@ -0,0 +1,116 @@
+"""
+Async versions of the read-only endpoints of the API, served under api/async/.
+They answer with the same payloads as the DRF views but run on the event loop
+under ASGI instead of occupying a thread of the sync pool.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.urls import replace_query_param
+
+from ..models import Subject, Course, Module
+from ..pagination import CreatedKeysetPaginator, InvalidCursor
+from ..services import EnrollmentService
+from .authentication import API_AUTHENTICATION_CLASSES
+from .serializers import SubjectSerializer, CourseSerializer
+from .snapshots import aget_course_snapshot
+
+
+def _course_queryset():
+    # CourseSerializer lists the module ids of each course
+    return Course.objects.prefetch_related(
+        Prefetch('modules', queryset=Module.objects.only('id', 'course_id'))
+    )
+
+
+class AsyncSubjectListView(View):
+    replica_reads = True
+
+    async def get(self, request):
+        subjects = [subject async for subject in Subject.objects.all()]
+        return JsonResponse(SubjectSerializer(subjects, many=True).data, safe=False)
+
+
+class AsyncCourseListView(View):
+    """
+    Course list paginated by keyset, ?cursor=<cursor>&subject=<id or slug>
+    """
+    paginate_by = 20
+    replica_reads = True
+
+    async def get(self, request):
+        courses = _course_queryset()
+        subject = request.GET.get('subject')
+        if subject:
+            if subject.isdigit():
+                courses = courses.filter(subject_id=subject)
+            else:
+                courses = courses.filter(subject__slug=subject)
+        try:
+            page = await CreatedKeysetPaginator(courses, self.paginate_by).apage(request.GET.get('cursor'))
+        except InvalidCursor:
+            return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+        url = request.build_absolute_uri()
+        return JsonResponse({
+            'next': replace_query_param(url, 'cursor', page.next_cursor) if page.has_next else None,
+            'previous': (
+                replace_query_param(url, 'cursor', page.previous_cursor) if page.has_previous else None
+            ),
+            'results': CourseSerializer(page.object_list, many=True).data,
+        })
+
+
+class AsyncCourseDetailView(View):
+    replica_reads = True
+
+    async def get(self, request, pk):
+        try:
+            course = await _course_queryset().aget(pk=pk)
+        except Course.DoesNotExist:
+            raise Http404("No course found matching the query")
+        return JsonResponse(CourseSerializer(course).data)
+
+
+class AsyncCourseContentsView(View):
+    """
+    Modules and contents of a course for its enrolled students, with the
+    same authentication and validators as CourseViewSet.contents
+    """
+    @staticmethod
+    def authenticate(request):
+        for authentication_class in API_AUTHENTICATION_CLASSES:
+            credentials = authentication_class().authenticate(request)
+            if credentials is not None:
+                return credentials
+        return None
+
+    async def get(self, request, pk):
+        try:
+            credentials = await sync_to_async(self.authenticate)(request)
+        except AuthenticationFailed as exc:
+            credentials, detail = None, exc.detail
+        else:
+            detail = 'Authentication credentials were not provided.'
+        if credentials is None:
+            response = JsonResponse({'detail': detail}, status=401)
+            response['WWW-Authenticate'] = API_AUTHENTICATION_CLASSES[0]().authenticate_header(request)
+            return response
+        user = credentials[0]
+        if not await Course.objects.filter(pk=pk).aexists():
+            raise Http404("No course found matching the query")
+        if not await EnrollmentService.ais_enrolled(user, pk):
+            return JsonResponse(
+                {'detail': 'You do not have permission to perform this action.'}, status=403
+            )
+        snapshot = await aget_course_snapshot(pk)
+        etag = f'"{snapshot.etag}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(snapshot.payload, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
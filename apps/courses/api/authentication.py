@@ -0,0 +1,108 @@
+"""
+Authentication of the API actions of scripted clients.
+
+Checking a password runs the whole PBKDF2 hash, which costs more than the
+rest of an API request. Clients get a signed, expiring bearer token from
+``/api/token/`` instead, checked with one HMAC and one user lookup. For
+clients still sending Basic credentials, verified credentials are kept in
+the cache for a short while under an HMAC of the email and password.
+
+Tokens and cached credentials carry a fingerprint of the password hash, so
+changing the password revokes them.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, BasicAuthentication, get_authorization_header
+
+from learnXpert.metrics import record_cache
+
+TOKEN_SALT = 'apps.courses.api.token'
+CREDENTIALS_SALT = 'apps.courses.api.credentials'
+
+
+def password_fingerprint(user):
+    return salted_hmac(TOKEN_SALT, user.password, algorithm='sha256').hexdigest()[:16]
+
+
+def _active_user(user_id, fingerprint):
+    """
+    The active user ``user_id`` if the password did not change since
+    ``fingerprint`` was taken, or None
+    """
+    user = get_user_model()._default_manager.filter(pk=user_id).first()
+    if user is None or not user.is_active or not constant_time_compare(password_fingerprint(user), fingerprint):
+        return None
+    return user
+
+
+def make_token(user):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(f'{user.pk}:{password_fingerprint(user)}')
+
+
+def get_token_user(token):
+    """
+    The user of a valid and unexpired token, or None
+    """
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.API_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    user_id, _, fingerprint = value.partition(':')
+    return _active_user(user_id, fingerprint)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    ``Authorization: Bearer <token>`` with a token of ``/api/token/``
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        user = get_token_user(token)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid or expired token.')
+        return user, token
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+def credentials_key(userid, password):
+    # the HMAC keeps passwords out of the cache
+    digest = salted_hmac(CREDENTIALS_SALT, f'{userid}\0{password}', algorithm='sha256').hexdigest()
+    return f'credentials:{digest}'
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication hashing the password once per
+    BASIC_AUTH_CACHE_TIMEOUT for a given email and password
+    """
+    def authenticate_credentials(self, userid, password, request=None):
+        key = credentials_key(userid, password)
+        cached = cache.get(key)
+        record_cache('credentials', cached is not None)
+        if cached is not None:
+            user = _active_user(*cached)
+            if user is not None:
+                return user, None
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(key, (user.pk, password_fingerprint(user)), settings.BASIC_AUTH_CACHE_TIMEOUT)
+        return user, auth
+
+
+# authentication of the API actions of scripted clients
+API_AUTHENTICATION_CLASSES = [CachedBasicAuthentication, SignedTokenAuthentication]
@@ -1,6 +1,16 @@
 from rest_framework.permissions import BasePermission
 
+from ..services import EnrollmentService
+
 
 class IsEnrolled(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.students.filter(id=request.user.id).exists()
+        return EnrollmentService.is_enrolled(request.user, obj.pk)
+
+
+class IsCourseOwner(BasePermission):
+    """
+    The instructor of the course, or staff
+    """
+    def has_object_permission(self, request, view, obj):
+        return request.user.is_staff or obj.owner_id == request.user.pk
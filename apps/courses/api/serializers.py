@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from ..models import Subject, Course, Module, Content
+from ..models import Subject, Course, Module, Content, SearchEntry
 
 
 class SubjectSerializer(serializers.ModelSerializer):
@@ -42,6 +42,15 @@ class ModuleWithContentsSerializer(serializers.ModelSerializer):
         fields = ['order', 'title', 'description', 'contents']
 
 
+class CourseWithModulesSerializer(serializers.ModelSerializer):
+    modules = ModuleSerializer(many=True)
+
+    class Meta:
+        model = Course
+        fields = ['id', 'subject', 'title', 'slug',
+                  'overview', 'created', 'owner', 'modules']
+
+
 class CourseWithContentsSerializer(serializers.ModelSerializer):
     modules = ModuleWithContentsSerializer(many=True)
 
@@ -49,3 +58,20 @@ class CourseWithContentsSerializer(serializers.ModelSerializer):
         model = Course
         fields = ['id', 'subject', 'title', 'slug',
                   'overview', 'created', 'owner', 'modules']
+
+
+class BatchEnrollSerializer(serializers.Serializer):
+    courses = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500
+    )
+
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    type = serializers.CharField(source='content_type.model')
+    rank = serializers.FloatField()
+
+    class Meta:
+        model = SearchEntry
+        fields = ['type', 'object_id', 'title', 'course', 'rank']
@@ -0,0 +1,74 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from learnXpert.db_router import use_primary
+from rest_framework.renderers import JSONRenderer
+
+from ..managers import prefetch_contents
+from ..models import Course, CourseSnapshot, Content
+from .serializers import CourseWithContentsSerializer
+
+
+def build_course_snapshot(course_id):
+    """
+    Serialize a course with its modules and contents and store the result
+    under the contents version read with the course. A change committed
+    while building has moved the course to a newer version, the snapshot
+    is then never served.
+    """
+    with use_primary():
+        course = Course.objects.prefetch_related(
+            prefetch_contents('modules__contents')
+        ).get(pk=course_id)
+    payload = JSONRenderer().render(CourseWithContentsSerializer(course).data)
+    snapshot, _ = CourseSnapshot.objects.update_or_create(
+        course=course,
+        defaults={
+            'payload': payload.decode(),
+            'etag': hashlib.sha256(payload).hexdigest(),
+            'version': course.contents_version,
+        }
+    )
+    return snapshot
+
+
+def _current_snapshot(course_id):
+    return CourseSnapshot.objects.filter(course_id=course_id, version=F('course__contents_version'))
+
+
+def get_course_snapshot(course_id):
+    """
+    Return the snapshot of the current contents of a course, building it
+    when missing or stale
+    """
+    with use_primary():
+        snapshot = _current_snapshot(course_id).first()
+    return snapshot or build_course_snapshot(course_id)
+
+
+async def aget_course_snapshot(course_id):
+    with use_primary():
+        snapshot = await _current_snapshot(course_id).afirst()
+    return snapshot or await sync_to_async(build_course_snapshot)(course_id)
+
+
+def invalidate_course_snapshots(course_ids):
+    """
+    Move the given courses to a new contents version, within the
+    transaction of the change, their snapshots are rebuilt on next read
+    """
+    Course.objects.filter(pk__in=set(course_ids)).update(contents_version=F('contents_version') + 1)
+
+
+def invalidate_item_snapshots(item):
+    """
+    Drop the snapshots of every course that contains the given item
+    """
+    course_ids = Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(item),
+        object_id=item.pk
+    ).values_list('module__course_id', flat=True)
+    invalidate_course_snapshots(course_ids)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework import routers
-from . import views
+from . import views, async_views
 
 router = routers.DefaultRouter()
 router.register('courses', views.CourseViewSet)
@@ -18,6 +18,36 @@ urlpatterns = [
         views.SubjectDetailView.as_view(),
         name='subject_detail'
     ),
+    path(
+        'token/',
+        views.TokenView.as_view(),
+        name='token'
+    ),
+    path(
+        'search/',
+        views.SearchView.as_view(),
+        name='search'
+    ),
+    path(
+        'async/subjects/',
+        async_views.AsyncSubjectListView.as_view(),
+        name='async_subject_list'
+    ),
+    path(
+        'async/courses/',
+        async_views.AsyncCourseListView.as_view(),
+        name='async_course_list'
+    ),
+    path(
+        'async/courses/<int:pk>/',
+        async_views.AsyncCourseDetailView.as_view(),
+        name='async_course_detail'
+    ),
+    path(
+        'async/courses/<int:pk>/contents/',
+        async_views.AsyncCourseContentsView.as_view(),
+        name='async_course_contents'
+    ),
     # path(
     #     'courses/<pk>/enroll/',
     #     views.CourseEnrollView.as_view(),
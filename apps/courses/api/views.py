@@ -1,25 +1,95 @@
+import tempfile
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from ..models import Subject, Course
-from ..api.serializers import SubjectSerializer, CourseSerializer, CourseWithContentsSerializer
-from .permissions import IsEnrolled
+from ..models import Subject, Course, Module
+from ..api.serializers import (
+    SubjectSerializer, CourseSerializer, CourseWithContentsSerializer, BatchEnrollSerializer,
+    SearchResultSerializer
+)
+from ..conditional import catalog_condition, subject_validators, course_resource_validators
+from ..archive import ArchiveError, export_course_archive, import_course_archive
+from ..export import EXPORT_MODES, EXPANSIONS, stream_courses
+from ..search import MAX_SEARCH_PAGE, search_page, text_course_ids
+from ..services import EnrollmentService
+from .authentication import API_AUTHENTICATION_CLASSES, make_token
+from .pagination import CourseCursorPagination
+from .permissions import IsEnrolled, IsCourseOwner
+from .snapshots import get_course_snapshot
 from rest_framework.authentication import BasicAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated, AllowAny, DjangoModelPermissions
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 
 
 class SubjectListView(ListAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+    replica_reads = True
 
 
+@method_decorator(catalog_condition(subject_validators), name='get')
 class SubjectDetailView(RetrieveAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+    replica_reads = True
+
+
+class SearchView(APIView):
+    """
+    Ranked full-text search over courses, modules and the texts of the
+    courses the user owns or is enrolled in, ?q=<terms>&page=<n>
+    """
+    permission_classes = [AllowAny]
+    page_size = 20
+
+    def get(self, request, format=None):
+        query = request.query_params.get('q', '')
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        if page > MAX_SEARCH_PAGE:
+            raise NotFound('Invalid page.')
+        entries, has_next = search_page(query, page, self.page_size, text_course_ids(request.user))
+        url = request.build_absolute_uri()
+        next_url = replace_query_param(url, 'page', page + 1) if has_next else None
+        previous_url = None
+        if page > 2:
+            previous_url = replace_query_param(url, 'page', page - 1)
+        elif page == 2:
+            previous_url = remove_query_param(url, 'page')
+        return Response({
+            'next': next_url,
+            'previous': previous_url,
+            'results': SearchResultSerializer(entries, many=True).data,
+        })
+
+
+class TokenView(APIView):
+    """
+    Signed bearer token of the user, for the API actions otherwise
+    authenticated with Basic credentials
+    """
+    authentication_classes = [BasicAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        return Response({
+            'token': make_token(request.user),
+            'expires_in': settings.API_TOKEN_MAX_AGE,
+        })
 
 
 # class CourseEnrollView(APIView):
@@ -35,17 +105,116 @@ class SubjectDetailView(RetrieveAPIView):
 class CourseViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
+    pagination_class = CourseCursorPagination
+    # GET requests read from the replicas, see learnXpert.db_router
+    replica_reads = True
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # CourseSerializer lists the module ids of each course
+            qs = qs.prefetch_related(Prefetch('modules', queryset=Module.objects.only('id', 'course_id')))
+        subject = self.request.query_params.get('subject')
+        if self.action == 'list' and subject:
+            # filter by subject id or slug
+            if subject.isdigit():
+                qs = qs.filter(subject_id=subject)
+            else:
+                qs = qs.filter(subject__slug=subject)
+        return qs
+
+    @method_decorator(catalog_condition(course_resource_validators))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream the whole catalog, ?mode=ndjson|json&expand=modules|contents
+        """
+        mode = request.query_params.get('mode', 'ndjson')
+        expand = request.query_params.get('expand') or None
+        if mode not in EXPORT_MODES or expand not in EXPANSIONS:
+            raise ValidationError({'detail': 'Unknown export mode or expansion'})
+        if expand == 'contents' and not request.user.is_staff:
+            # contents are otherwise only served to enrolled students
+            raise PermissionDenied()
+        response = StreamingHttpResponse(stream_courses(mode, expand), content_type=EXPORT_MODES[mode])
+        response['Content-Disposition'] = f'attachment; filename="courses.{mode}"'
+        return response
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, IsCourseOwner])
+    def archive(self, request, *args, **kwargs):
+        """
+        Zip archive of the course with its contents and media, to be
+        imported with import-archive
+        """
+        course = self.get_object()
+        # spooled to disk, the archive holds the media of the course
+        fileobj = tempfile.TemporaryFile()
+        export_course_archive(course, fileobj)
+        fileobj.seek(0)
+        return FileResponse(
+            fileobj, as_attachment=True, filename=f'{course.slug}.zip', content_type='application/zip'
+        )
+
+    @action(detail=False, methods=['post'], url_path='import-archive',
+            parser_classes=[MultiPartParser], permission_classes=[DjangoModelPermissions])
+    def import_archive(self, request, *args, **kwargs):
+        """
+        Create a course owned by the user from the uploaded ``archive``,
+        in the subject of the archive or the ``subject`` id given
+        """
+        upload = request.FILES.get('archive')
+        if upload is None:
+            raise ValidationError({'archive': 'No archive uploaded'})
+        subject = request.data.get('subject')
+        if subject:
+            subject = Subject.objects.filter(pk=subject).first() if str(subject).isdigit() else None
+            if subject is None:
+                raise ValidationError({'subject': 'Unknown subject'})
+        try:
+            course = import_course_archive(upload, request.user, subject=subject or None,
+                                           slug=request.data.get('slug'))
+        except ArchiveError as exc:
+            raise ValidationError({'archive': str(exc)})
+        return Response(CourseSerializer(course).data, status=201)
 
     @action(detail=True, methods=['post'],
-            authentication_classes=[BasicAuthentication], permission_classes=[IsAuthenticated])
+            authentication_classes=API_AUTHENTICATION_CLASSES, permission_classes=[IsAuthenticated])
     def enroll(self, request, *args, **kwargs):
         course = self.get_object()
-        course.students.add(request.user)
+        EnrollmentService.enroll(request.user, course)
         return Response({"enrolled": True})
 
+    @action(detail=True, methods=['post'],
+            authentication_classes=API_AUTHENTICATION_CLASSES, permission_classes=[IsAuthenticated])
+    def unenroll(self, request, *args, **kwargs):
+        course = self.get_object()
+        EnrollmentService.unenroll(request.user, course)
+        return Response({"enrolled": False})
+
+    @action(detail=False, methods=['post'], url_path='batch-enroll',
+            serializer_class=BatchEnrollSerializer,
+            authentication_classes=API_AUTHENTICATION_CLASSES, permission_classes=[IsAuthenticated])
+    def batch_enroll(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = EnrollmentService.enroll_many(request.user, serializer.validated_data['courses'])
+        return Response({"results": results})
+
     @action(detail=True, methods=['get'],
             serializer_class=CourseWithContentsSerializer,
-            authentication_classes=[BasicAuthentication],
+            authentication_classes=API_AUTHENTICATION_CLASSES,
             permission_classes=[IsAuthenticated, IsEnrolled])
     def contents(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        # checks the object permissions, i.e. the enrollment
+        course = self.get_object()
+        snapshot = get_course_snapshot(course.pk)
+        etag = f'"{snapshot.etag}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(snapshot.payload, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
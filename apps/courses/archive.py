@@ -0,0 +1,353 @@
+"""
+Course archives, to move a course between environments.
+
+An archive is a zip file holding:
+
+* ``contents.ndjson``, one line per content of the course in order, with
+  the index of its module, its type and the fields of its item;
+* ``media/<storage name>``, every file and image once;
+* ``manifest.json``, the format and version of the archive, the course,
+  its subject and its modules.
+
+Imports read the contents as a stream and insert them in batches, one
+bulk_create per item model and one bulk_append of contents per batch.
+"""
+import io
+import json
+import os
+import shutil
+import zipfile
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File as DjangoFile
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework import serializers
+
+from . import blobs
+from .models import RESERVED_COURSE_SLUGS, Subject, Course, Module, Content, Text, Video, Image, File
+from .storage import content_storage
+
+ARCHIVE_FORMAT = 'learnxpert-course'
+ARCHIVE_VERSION = 1
+# versions this code can import
+SUPPORTED_VERSIONS = (1,)
+
+MANIFEST = 'manifest.json'
+CONTENTS = 'contents.ndjson'
+MEDIA_DIR = 'media/'
+
+ITEM_MODELS = {
+    'text': Text,
+    'video': Video,
+    'image': Image,
+    'file': File,
+}
+# fields of each item written to the archive, besides the title
+ITEM_FIELDS = {
+    'text': ('content',),
+    'video': ('url',),
+    'image': ('width', 'height', 'format'),
+    'file': (),
+}
+
+
+class ArchiveError(Exception):
+    """
+    The archive is not a course archive this code can import
+    """
+
+
+# validation of the records of an archive against the columns they fill;
+# slugs are not checked for uniqueness, an existing subject is reused and
+# the course gets a free slug from unique_slug()
+class SubjectRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Subject
+        fields = ['title', 'slug']
+        extra_kwargs = {'slug': {'validators': []}}
+
+
+class CourseRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Course
+        fields = ['title', 'slug', 'overview']
+        extra_kwargs = {'slug': {'validators': []}, 'overview': {'allow_blank': True}}
+
+
+class ModuleRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Module
+        fields = ['title', 'description']
+        extra_kwargs = {'description': {'allow_blank': True}}
+
+
+class TextRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Text
+        fields = ['title', 'content']
+        extra_kwargs = {'content': {'allow_blank': True}}
+
+
+class VideoRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Video
+        fields = ['title', 'url']
+
+
+class ImageRecordSerializer(serializers.ModelSerializer):
+    # not editable, read from the upload otherwise
+    width = serializers.IntegerField(min_value=0, allow_null=True)
+    height = serializers.IntegerField(min_value=0, allow_null=True)
+    format = serializers.CharField(max_length=10, allow_blank=True)
+
+    class Meta:
+        model = Image
+        fields = ['title', 'width', 'height', 'format']
+
+
+class FileRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = File
+        fields = ['title']
+
+
+ITEM_SERIALIZERS = {
+    'text': TextRecordSerializer,
+    'video': VideoRecordSerializer,
+    'image': ImageRecordSerializer,
+    'file': FileRecordSerializer,
+}
+
+
+def _validated(serializer, data, where):
+    """
+    Validated data of a record, with one serializer instance reused for the
+    records of a kind
+    """
+    try:
+        return serializer.run_validation(data)
+    except serializers.ValidationError as exc:
+        detail = exc.detail if isinstance(exc.detail, dict) else {'record': exc.detail}
+        errors = '; '.join(
+            '{}: {}'.format(field, ' '.join(str(error) for error in field_errors))
+            for field, field_errors in detail.items()
+        )
+        raise ArchiveError(f'Invalid {where}: {errors}') from exc
+
+
+def _item_record(kind, item):
+    record = {'type': kind, 'title': item.title}
+    for field in ITEM_FIELDS[kind]:
+        record[field] = getattr(item, field)
+    if kind in ('image', 'file'):
+        record['media'] = getattr(item, blobs.BLOB_FIELDS[type(item)]).name
+    return record
+
+
+def export_course_archive(course, fileobj, chunk_size=1000):
+    """
+    Write the archive of ``course`` to the binary file object ``fileobj``.
+    Contents are read ``chunk_size`` rows at a time and media are copied
+    from the storage in chunks, so memory use does not depend on the size
+    of the course.
+    """
+    modules = list(course.modules.all())
+    module_indexes = {module.pk: index for index, module in enumerate(modules)}
+    kinds = {
+        content_type.pk: model._meta.model_name
+        for model, content_type in ContentType.objects.get_for_models(*ITEM_MODELS.values()).items()
+    }
+    media, count = {}, 0
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(CONTENTS, 'w') as raw, io.TextIOWrapper(raw, encoding='utf-8') as output:
+            contents = Content.objects.filter(module__course=course).order_by('module__order', 'order')
+            for content in contents.with_items().iterator(chunk_size=chunk_size):
+                record = _item_record(kinds[content.content_type_id], content.item)
+                record['module'] = module_indexes[content.module_id]
+                if record.get('media'):
+                    media[record['media']] = None
+                output.write(json.dumps(record) + '\n')
+                count += 1
+        for name in media:
+            # media are compressed formats already
+            with content_storage.open(name, 'rb') as source, \
+                    archive.open(zipfile.ZipInfo(MEDIA_DIR + name), 'w') as target:
+                shutil.copyfileobj(source, target, content_storage.chunk_size)
+        archive.writestr(MANIFEST, json.dumps({
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_VERSION,
+            'exported_at': timezone.now().isoformat(),
+            'subject': {'title': course.subject.title, 'slug': course.subject.slug},
+            'course': {'title': course.title, 'slug': course.slug, 'overview': course.overview},
+            'modules': [{'title': module.title, 'description': module.description} for module in modules],
+            'contents': count,
+            'media': len(media),
+        }, indent=2))
+    return count
+
+
+def check_limits(archive):
+    """
+    Reject archives declaring more entries or uncompressed bytes than
+    allowed, zipfile never reads past the declared size of an entry
+    """
+    infos = archive.infolist()
+    if len(infos) > settings.ARCHIVE_MAX_ENTRIES:
+        raise ArchiveError(f'More than {settings.ARCHIVE_MAX_ENTRIES} entries')
+    if sum(info.file_size for info in infos) > settings.ARCHIVE_MAX_SIZE:
+        raise ArchiveError(f'Larger than {settings.ARCHIVE_MAX_SIZE} bytes uncompressed')
+
+
+def read_manifest(archive):
+    try:
+        if archive.getinfo(MANIFEST).file_size > settings.ARCHIVE_MAX_RECORD_SIZE:
+            raise ArchiveError(f'{MANIFEST} is larger than {settings.ARCHIVE_MAX_RECORD_SIZE} bytes')
+        manifest = json.loads(archive.read(MANIFEST))
+    except (KeyError, ValueError) as exc:
+        raise ArchiveError(f'Missing or invalid {MANIFEST}') from exc
+    if not isinstance(manifest, dict) or manifest.get('format') != ARCHIVE_FORMAT:
+        raise ArchiveError('Not a course archive')
+    if manifest.get('version') not in SUPPORTED_VERSIONS:
+        raise ArchiveError(f"Unsupported archive version {manifest.get('version')}")
+    return manifest
+
+
+def unique_slug(slug):
+    """
+    ``slug`` or the first of ``slug-2``, ``slug-3``... no course uses and
+    not reserved
+    """
+    slug = slugify(slug)[:190] or 'course'
+    taken = set(Course.objects.filter(slug__startswith=slug).values_list('slug', flat=True))
+    taken.update(RESERVED_COURSE_SLUGS)
+    candidate, number = slug, 1
+    while candidate in taken:
+        number += 1
+        candidate = f'{slug}-{number}'
+    return candidate
+
+
+def _store_media(archive, directories):
+    """
+    Copy the media of the archive to the storage, returning the stored name
+    of each archived name. Media are hashed again on the way in, the names
+    of the archive are not trusted.
+    """
+    stored = {}
+    for info in archive.infolist():
+        if not info.filename.startswith(MEDIA_DIR) or info.is_dir():
+            continue
+        name = info.filename[len(MEDIA_DIR):]
+        upload_to = name.split('/', 1)[0]
+        if upload_to not in directories:
+            raise ArchiveError(f'Unexpected media {info.filename}')
+        with archive.open(info) as source:
+            # ContentAddressedStorage reads the file in chunks
+            stored[name] = content_storage.save(
+                f'{upload_to}/upload{os.path.splitext(name)[1]}', DjangoFile(source, name=name)
+            )
+    return stored
+
+
+def _import_batch(records, modules, content_types, owner, media):
+    items = {kind: [] for kind in ITEM_MODELS}
+    for record in records:
+        kind = record['type']
+        fields = {field: record[field] for field in ITEM_FIELDS[kind]}
+        if kind in ('image', 'file'):
+            fields[blobs.BLOB_FIELDS[ITEM_MODELS[kind]]] = media[record['media']]
+        items[kind].append(ITEM_MODELS[kind](owner=owner, title=record['title'], **fields))
+    created = {kind: iter(ITEM_MODELS[kind].objects.bulk_create(objs)) for kind, objs in items.items() if objs}
+    Content.objects.bulk_append([
+        Content(
+            module=modules[record['module']], content_type=content_types[record['type']],
+            object_id=next(created[record['type']]).pk
+        )
+        for record in records
+    ])
+    # bulk_create skips the receivers counting the blob references
+    blobs.add_references(media[record['media']] for record in records if record['type'] in ('image', 'file'))
+
+
+def _records(archive, module_count, media):
+    item_serializers = {kind: serializer_class() for kind, serializer_class in ITEM_SERIALIZERS.items()}
+    limit = settings.ARCHIVE_MAX_RECORD_SIZE
+    with archive.open(CONTENTS) as raw:
+        for number, line in enumerate(iter(lambda: raw.readline(limit + 1), b''), 1):
+            if len(line) > limit:
+                raise ArchiveError(f'Line {number} of {CONTENTS} is longer than {limit} bytes')
+            try:
+                record = json.loads(line)
+                valid = (
+                    record['type'] in ITEM_MODELS
+                    and isinstance(record['module'], int)
+                    and 0 <= record['module'] < module_count
+                    and (record['type'] not in ('image', 'file') or record['media'] in media)
+                )
+            except (ValueError, KeyError, TypeError) as exc:
+                raise ArchiveError(f'Invalid content on line {number} of {CONTENTS}') from exc
+            if not valid:
+                raise ArchiveError(f'Invalid content on line {number} of {CONTENTS}')
+            fields = _validated(
+                item_serializers[record['type']], record, f'content on line {number} of {CONTENTS}'
+            )
+            yield {**fields, 'type': record['type'], 'module': record['module'], 'media': record.get('media')}
+
+
+def import_course_archive(fileobj, owner, subject=None, slug=None, batch_size=1000):
+    """
+    Create a course owned by ``owner`` from the archive in ``fileobj``, in
+    ``subject`` or the subject of the archive, created when missing if
+    ``owner`` may add subjects. The slug of the archive is kept unless
+    taken. Returns the new course.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as exc:
+        raise ArchiveError('Not a zip file') from exc
+    with archive:
+        check_limits(archive)
+        manifest = read_manifest(archive)
+        if not isinstance(manifest.get('modules'), list):
+            raise ArchiveError(f'Invalid modules in {MANIFEST}')
+        subject_data = _validated(SubjectRecordSerializer(), manifest.get('subject'), f'subject in {MANIFEST}')
+        course_data = _validated(CourseRecordSerializer(), manifest.get('course'), f'course in {MANIFEST}')
+        module_serializer = ModuleRecordSerializer()
+        module_data = [
+            _validated(module_serializer, module, f'module {index} in {MANIFEST}')
+            for index, module in enumerate(manifest['modules'], 1)
+        ]
+        if subject is None:
+            subject = Subject.objects.filter(slug=subject_data['slug']).first()
+            if subject is None and not owner.has_perm('courses.add_subject'):
+                raise ArchiveError(f"No subject {subject_data['slug']}, choose an existing subject")
+        directories = {model._meta.get_field(field).upload_to for model, field in blobs.BLOB_FIELDS.items()}
+        # stored before the transaction, files of a failed import are left
+        # to gc_blobs
+        media = _store_media(archive, directories)
+        content_types = {
+            model._meta.model_name: content_type
+            for model, content_type in ContentType.objects.get_for_models(*ITEM_MODELS.values()).items()
+        }
+        with transaction.atomic():
+            if subject is None:
+                subject, _ = Subject.objects.get_or_create(slug=subject_data['slug'], defaults=subject_data)
+            course = Course.objects.create(
+                owner=owner, subject=subject, title=course_data['title'],
+                slug=unique_slug(slug or course_data['slug']), overview=course_data['overview']
+            )
+            modules = Module.objects.bulk_append([
+                Module(course=course, **module) for module in module_data
+            ])
+            batch = []
+            for record in _records(archive, len(modules), media):
+                batch.append(record)
+                if len(batch) == batch_size:
+                    _import_batch(batch, modules, content_types, owner, media)
+                    batch = []
+            if batch:
+                _import_batch(batch, modules, content_types, owner, media)
+    return course
@@ -0,0 +1,208 @@
+"""
+Synthetic catalog seeding and request scenarios of the ``bench`` command
+"""
+import base64
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..users.models import User
+from .counters import refresh_subject_counters, refresh_course_counters
+from .models import Subject, Course, Module, Content, Text, Video, Image, File
+from .search import index_objects
+
+BENCH_PASSWORD = 'bench-password'
+ITEM_KINDS = ('text', 'video', 'image', 'file')
+
+
+class Catalog:
+    """
+    What the scenarios need to know about the seeded data
+    """
+    def __init__(self, owner, student, course, module):
+        self.owner = owner
+        self.student = student
+        self.course = course
+        self.module = module
+
+
+def seed_catalog(subjects=5, courses=50, modules=8, contents=10, students=200, enrollments=5, seed=0):
+    """
+    Create a synthetic catalog with bulk inserts: ``courses`` courses spread
+    over ``subjects`` subjects, each with ``modules`` modules of ``contents``
+    mixed items, and ``students`` students enrolled in ``enrollments``
+    courses each
+    """
+    rng = random.Random(seed)
+    password = make_password(BENCH_PASSWORD)
+    owner = User.objects.create(
+        email='owner@bench.local', password=password, first_name='Bench', last_name='Owner', is_active=True
+    )
+    users = User.objects.bulk_create([
+        User(email=f'student{i}@bench.local', password=password, first_name='Student', last_name=str(i),
+             is_active=True)
+        for i in range(students)
+    ])
+    subject_objs = Subject.objects.bulk_create([
+        Subject(title=f'Subject {i}', slug=f'subject-{i}') for i in range(subjects)
+    ])
+    course_objs = Course.objects.bulk_create([
+        Course(owner=owner, subject=subject_objs[i % subjects], title=f'Course {i}', slug=f'course-{i}',
+               overview=f'Overview of course {i} ' * 20)
+        for i in range(courses)
+    ])
+    index_objects(course_objs)
+    for course in course_objs:
+        module_objs = Module.objects.bulk_append([
+            Module(course=course, title=f'Module {m}', description=f'Module {m} of {course.title}')
+            for m in range(modules)
+        ])
+        kinds = [ITEM_KINDS[rng.randrange(len(ITEM_KINDS))] for _ in range(modules * contents)]
+        items = {
+            'text': Text.objects.bulk_create([
+                Text(owner=owner, title=f'Text {i}', content='Lorem ipsum dolor sit amet. ' * 40)
+                for i, kind in enumerate(kinds) if kind == 'text'
+            ]),
+            'video': Video.objects.bulk_create([
+                Video(owner=owner, title=f'Video {i}', url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+                for i, kind in enumerate(kinds) if kind == 'video'
+            ]),
+            'image': Image.objects.bulk_create([
+                Image(owner=owner, title=f'Image {i}', image=f'images/bench-{i}.jpg', width=1600, height=900,
+                      format='JPEG')
+                for i, kind in enumerate(kinds) if kind == 'image'
+            ]),
+            'file': File.objects.bulk_create([
+                File(owner=owner, title=f'File {i}', file=f'files/bench-{i}.pdf')
+                for i, kind in enumerate(kinds) if kind == 'file'
+            ]),
+        }
+        iterators = {kind: iter(objs) for kind, objs in items.items()}
+        Content.objects.bulk_append([
+            Content(module=module_objs[i // contents], item=next(iterators[kind]))
+            for i, kind in enumerate(kinds)
+        ])
+    course = course_objs[0]
+    Enrollment = Course.students.through
+    enrolled = {(users[0].pk, course.pk)}
+    for user in users:
+        for other in rng.sample(course_objs, min(enrollments, courses)):
+            enrolled.add((user.pk, other.pk))
+    Enrollment.objects.bulk_create([
+        Enrollment(user_id=user_id, course_id=course_id) for user_id, course_id in enrolled
+    ], batch_size=1000)
+    # bulk inserts bypass the counter receivers
+    refresh_subject_counters()
+    refresh_course_counters()
+    return Catalog(owner, users[0], course, course.modules.first())
+
+
+def _basic_auth(user):
+    credentials = base64.b64encode(f'{user.email}:{BENCH_PASSWORD}'.encode()).decode()
+    return {'HTTP_AUTHORIZATION': f'Basic {credentials}'}
+
+
+def scenarios(catalog):
+    """
+    Name and request callable of every scenario, each callable taking the
+    iteration number and returning a response
+    """
+    anonymous = Client()
+    student = Client()
+    student.force_login(catalog.student)
+    owner = Client()
+    owner.force_login(catalog.owner)
+    course = catalog.course
+    module_ids = list(course.modules.values_list('id', flat=True))
+    urls = {
+        'catalog': reverse('courses:course_list'),
+        'course_detail': reverse('courses:course_detail', args=[course.slug]),
+        'student_course_detail': reverse('students:student_course_detail', args=[course.pk]),
+        'contents_api': reverse('api:course-contents', args=[course.pk]),
+        'reorder': reverse('courses:module_order'),
+    }
+
+    def reorder(iteration):
+        # alternate between two orders so that every request moves rows
+        ids = module_ids if iteration % 2 else module_ids[::-1]
+        return owner.post(
+            urls['reorder'], json.dumps({pk: position for position, pk in enumerate(ids)}),
+            content_type='application/json'
+        )
+
+    return {
+        'catalog': lambda iteration: anonymous.get(urls['catalog']),
+        'course_detail': lambda iteration: anonymous.get(urls['course_detail']),
+        'student_course_detail': lambda iteration: student.get(urls['student_course_detail']),
+        'contents_api': lambda iteration: anonymous.get(urls['contents_api'], **_basic_auth(catalog.student)),
+        'reorder': reorder,
+    }
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(request, iterations=50, warmup=5):
+    """
+    Query count, p50/p99 latency in milliseconds and peak traced memory in
+    KiB of a scenario
+    """
+    for iteration in range(warmup):
+        request(iteration)
+    timings, queries = [], 0
+    for iteration in range(iterations):
+        # replica aliases included
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+            start = time.perf_counter()
+            response = request(warmup + iteration)
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'Request failed with status {response.status_code}')
+        queries = max(queries, sum(len(context) for context in captured))
+    # tracing slows allocations down, measure memory on a separate request
+    tracemalloc.start()
+    try:
+        request(warmup + iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': queries,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance, query_tolerance=0):
+    """
+    Regressions of ``results`` against ``baseline``: more queries than the
+    baseline plus ``query_tolerance``, or latency or memory exceeding it by
+    more than the ``tolerance`` fraction
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries'] + query_tolerance:
+            regressions.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+        for metric in ('p50_ms', 'p99_ms', 'peak_kib'):
+            limit = expected[metric] * (1 + tolerance)
+            if result[metric] > limit:
+                regressions.append(
+                    f"{name}: {metric} {result[metric]}, baseline {expected[metric]} (limit {limit:.1f})"
+                )
+    return regressions
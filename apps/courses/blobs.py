@@ -0,0 +1,166 @@
+import os
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .images import delete_derivatives
+from .models import Blob, File, Image
+from .storage import content_storage
+
+# item models storing their file in the content addressed storage
+BLOB_FIELDS = {
+    File: 'file',
+    Image: 'image',
+}
+
+
+def add_reference(name):
+    add_references([name])
+
+
+def add_references(names):
+    """
+    Count one more reference per occurrence of a name, for items created
+    with bulk_create which skips the receivers
+    """
+    counts = Counter(names)
+    Blob.objects.bulk_create([Blob(name=name) for name in counts], ignore_conflicts=True)
+    by_count = defaultdict(list)
+    for name, count in counts.items():
+        by_count[count].append(name)
+    for count, count_names in by_count.items():
+        Blob.objects.filter(pk__in=count_names).update(refcount=F('refcount') + count, unreferenced_since=None)
+
+
+def mark_live(name):
+    """
+    Restart the grace period of a stored file an upload was deduplicated
+    to, before its item is saved. Returns False when the blob was collected
+    in the meantime, the file has to be stored again.
+    """
+    now = timezone.now()
+    Blob.objects.bulk_create([Blob(name=name, unreferenced_since=now)], ignore_conflicts=True)
+    # waits for a collection holding the row lock
+    return bool(Blob.objects.filter(pk=name).update(
+        unreferenced_since=Case(When(refcount=0, then=Value(now)), default=F('unreferenced_since'))
+    ))
+
+
+def remove_reference(name):
+    # unreferenced_since is set first, so that it reads the old refcount
+    # on backends assigning the columns in order
+    Blob.objects.filter(pk=name).update(
+        unreferenced_since=Case(
+            When(refcount__lte=1, then=Value(timezone.now())),
+            default=F('unreferenced_since')
+        ),
+        refcount=Greatest(F('refcount') - 1, Value(0)),
+    )
+
+
+def rebuild_references():
+    """
+    Recompute the reference counts of every blob from the items
+    """
+    counts = {}
+    for model, field in BLOB_FIELDS.items():
+        for name in model.objects.exclude(**{field: ''}).values_list(field, flat=True):
+            counts[name] = counts.get(name, 0) + 1
+    Blob.objects.bulk_create([Blob(name=name) for name in counts], ignore_conflicts=True)
+    blobs = list(Blob.objects.all())
+    now = timezone.now()
+    for blob in blobs:
+        blob.refcount = counts.get(blob.name, 0)
+        if blob.refcount:
+            blob.unreferenced_since = None
+        elif blob.unreferenced_since is None:
+            blob.unreferenced_since = now
+    Blob.objects.bulk_update(blobs, ['refcount', 'unreferenced_since'], batch_size=500)
+    return len(blobs)
+
+
+def _stored_files(storage, directory=''):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}' if directory else name
+    for name in directories:
+        yield from _stored_files(storage, f'{directory}/{name}' if directory else name)
+
+
+def _delete_blob(name, cutoff, dry_run, storage):
+    """
+    Delete an unreferenced blob and its file under the row lock, so that an
+    upload deduplicating to it either comes first and keeps it, or waits and
+    stores the file again. Returns the size of the deleted file, or None when
+    the blob was referenced again in the meantime.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(
+            pk=name, refcount=0, unreferenced_since__lt=cutoff
+        ).first()
+        if blob is None:
+            return None
+        size = 0
+        if storage.exists(name):
+            size = storage.size(name)
+            if not dry_run:
+                storage.delete(name)
+                delete_derivatives(name)
+        if not dry_run:
+            blob.delete()
+        return size
+
+
+def collect_garbage(grace=timedelta(days=1), dry_run=False, storage=content_storage):
+    """
+    Delete the blobs that have been unreferenced for longer than ``grace``,
+    and the content addressed files older than ``grace`` that have no blob,
+    e.g. left behind by a rolled back upload. Returns the number of deleted
+    files and their total size.
+    """
+    cutoff = timezone.now() - grace
+    deleted, size = 0, 0
+    for name in Blob.objects.filter(refcount=0, unreferenced_since__lt=cutoff).values_list('name', flat=True):
+        blob_size = _delete_blob(name, cutoff, dry_run, storage)
+        if blob_size is not None:
+            size += blob_size
+            deleted += 1
+    if not os.path.isdir(storage.location):
+        return deleted, size
+    # temporary files of interrupted uploads
+    for name in storage.listdir('')[1]:
+        if name.startswith('.upload-') and storage.get_modified_time(name) < cutoff:
+            size += storage.size(name)
+            if not dry_run:
+                storage.delete(name)
+            deleted += 1
+    candidates = []
+    directories = {model._meta.get_field(field).upload_to for model, field in BLOB_FIELDS.items()}
+    for directory in directories:
+        if storage.exists(directory):
+            candidates.extend(name for name in _stored_files(storage, directory) if storage.is_hashed_name(name))
+    modified = {name: storage.get_modified_time(name) for name in candidates}
+    candidates = [name for name in candidates if modified[name] < cutoff]
+    for start in range(0, len(candidates), 500):
+        batch = candidates[start:start + 500]
+        known = set(Blob.objects.filter(pk__in=batch).values_list('name', flat=True))
+        orphans = [name for name in batch if name not in known]
+        if dry_run:
+            size += sum(storage.size(name) for name in orphans)
+            deleted += len(orphans)
+            continue
+        # the files without blob become unreferenced blobs, deleted under
+        # the row lock like the others
+        Blob.objects.bulk_create(
+            [Blob(name=name, unreferenced_since=modified[name]) for name in orphans], ignore_conflicts=True
+        )
+        for name in orphans:
+            blob_size = _delete_blob(name, cutoff, dry_run, storage)
+            if blob_size is not None:
+                size += blob_size
+                deleted += 1
+    return deleted, size
@@ -0,0 +1,215 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from learnXpert.metrics import record_cache
+
+
+def item_render_key(item):
+    """
+    Cache key of a rendered item, versioned by its modification time so
+    that saving the item makes the previous fragment unreachable
+    """
+    return "item:{}:{}:{}".format(
+        item._meta.model_name, item.pk, item.modified_at.timestamp()
+    )
+
+
+def get_rendered_item(item, render):
+    """
+    Return the cached fragment of an item, calling ``render`` on a miss
+    """
+    if item.pk is None or item.modified_at is None:
+        return render()
+    key = item_render_key(item)
+    html = cache.get(key)
+    record_cache('render', html is not None)
+    if html is None:
+        html = render()
+        cache.set(key, html, settings.RENDER_CACHE_TIMEOUT)
+    return html
+
+
+def delete_rendered_item(item):
+    cache.delete(item_render_key(item))
+
+
+def enrollment_key(user_id):
+    return f"enrollments:v3:{user_id}"
+
+
+def enrollment_tag(user_id):
+    return f"enrollments:{user_id}"
+
+
+def get_enrollment_version(user_id):
+    """
+    Version of the enrollments of a user, to be taken before reading them
+    """
+    return get_tag_versions([enrollment_tag(user_id)])[enrollment_tag(user_id)]
+
+
+async def aget_enrollment_version(user_id):
+    return (await aget_tag_versions([enrollment_tag(user_id)]))[enrollment_tag(user_id)]
+
+
+def _current_enrollments(user_id, values):
+    entry = values.get(enrollment_key(user_id))
+    if entry is not None and entry[2] != values.get(tag_key(enrollment_tag(user_id))):
+        # read before an enrollment change
+        entry = None
+    record_cache('enrollments', entry is not None)
+    return None if entry is None else entry[:2]
+
+
+def get_enrollments(user_id):
+    """
+    The time the enrollments of a user were read and the sorted list of the
+    ids of their courses, or None. The entry and the version of the
+    enrollments are read together.
+    """
+    values = cache.get_many([enrollment_key(user_id), tag_key(enrollment_tag(user_id))])
+    return _current_enrollments(user_id, values)
+
+
+async def aget_enrollments(user_id):
+    values = await cache.aget_many([enrollment_key(user_id), tag_key(enrollment_tag(user_id))])
+    return _current_enrollments(user_id, values)
+
+
+def set_enrollments(user_id, course_ids, version):
+    """
+    Cache the enrollments of a user read after taking ``version`` with
+    get_enrollment_version(), a change committed in the meantime has made
+    the entry stale
+    """
+    cache.set(
+        enrollment_key(user_id), (time.time(), list(course_ids), version), settings.ENROLLMENT_CACHE_TIMEOUT
+    )
+
+
+async def aset_enrollments(user_id, course_ids, version):
+    await cache.aset(
+        enrollment_key(user_id), (time.time(), list(course_ids), version), settings.ENROLLMENT_CACHE_TIMEOUT
+    )
+
+
+def delete_enrollments(user_ids):
+    delete_tags([enrollment_tag(user_id) for user_id in user_ids])
+
+
+def outline_key(course_id):
+    return f"outline:{course_id}"
+
+
+def outline_tag(course_id):
+    return f"outline:{course_id}"
+
+
+def get_outline_versions(course_id):
+    return get_tag_versions([outline_tag(course_id)])
+
+
+async def aget_outline_versions(course_id):
+    return await aget_tag_versions([outline_tag(course_id)])
+
+
+def get_outline(course_id):
+    return get_tagged(outline_key(course_id), 'outline')
+
+
+async def aget_outline(course_id):
+    return await aget_tagged(outline_key(course_id), 'outline')
+
+
+def set_outline(course_id, outline, versions):
+    """
+    Cache the outline of a course with the versions of
+    get_outline_versions(), taken before reading the course
+    """
+    set_tagged(outline_key(course_id), outline, versions, settings.OUTLINE_CACHE_TIMEOUT)
+
+
+async def aset_outline(course_id, outline, versions):
+    await aset_tagged(outline_key(course_id), outline, versions, settings.OUTLINE_CACHE_TIMEOUT)
+
+
+def delete_outlines(course_ids):
+    delete_tags([outline_tag(course_id) for course_id in course_ids])
+
+
+def tag_key(tag):
+    return f"tag:{tag}"
+
+
+def get_tag_versions(tags):
+    """
+    Current version of each tag, starting the missing ones from the clock
+    so that a version is never reused after an invalidation
+    """
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = time.time_ns()
+        for key in missing:
+            cache.add(key, version, None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+async def aget_tag_versions(tags):
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = time.time_ns()
+        for key in missing:
+            await cache.aadd(key, version, None)
+        versions.update(await cache.aget_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def delete_tags(tags):
+    """
+    Make every value cached under one of the tags stale
+    """
+    cache.delete_many([tag_key(tag) for tag in tags])
+
+
+def get_tagged(key, cache_name):
+    """
+    Value cached by set_tagged() while none of its tags changed, or None
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, versions = entry
+        current = cache.get_many([tag_key(tag) for tag in versions])
+        if any(current.get(tag_key(tag)) != version for tag, version in versions.items()):
+            entry = None
+    record_cache(cache_name, entry is not None)
+    return None if entry is None else value
+
+
+async def aget_tagged(key, cache_name):
+    entry = await cache.aget(key)
+    if entry is not None:
+        value, versions = entry
+        current = await cache.aget_many([tag_key(tag) for tag in versions])
+        if any(current.get(tag_key(tag)) != version for tag, version in versions.items()):
+            entry = None
+    record_cache(cache_name, entry is not None)
+    return None if entry is None else value
+
+
+def set_tagged(key, value, versions, timeout):
+    """
+    Cache ``value`` with the ``{tag: version}`` of get_tag_versions(),
+    taken before reading the data the value is built from
+    """
+    cache.set(key, (value, versions), timeout)
+
+
+async def aset_tagged(key, value, versions, timeout):
+    await cache.aset(key, (value, versions), timeout)
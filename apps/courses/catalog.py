@@ -0,0 +1,62 @@
+"""
+Page cache of the course catalog served to anonymous visitors.
+
+Rendered pages are cached with the versions of the tags of what they show:
+
+* ``catalog`` or ``subject:<id>``, the courses listed by the page;
+* ``subjects``, the subject list and its course counts;
+* ``course:<id>``, ``subject:<id>`` and ``user:<id>`` of each course shown,
+  its title and module count, subject and instructor name.
+
+The receivers in signals.py drop the tags touched by a change once it is
+committed, which makes exactly the pages showing it stale.
+"""
+import hashlib
+
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import get_tagged, set_tagged
+
+
+def page_key(subject_slug, cursor):
+    return "catalog:{}:{}".format(subject_slug or '', hashlib.sha256((cursor or '').encode()).hexdigest()[:32])
+
+
+def listing_tags(subject):
+    """
+    Tags of the course list and subjects of a page, known before reading it
+    """
+    return ['subjects', f'subject:{subject.pk}' if subject else 'catalog']
+
+
+def course_tags(courses):
+    tags = set()
+    for course in courses:
+        tags.update((f'course:{course.pk}', f'subject:{course.subject_id}', f'user:{course.owner_id}'))
+    return tags
+
+
+def get_page(request, subject_slug=None):
+    """
+    Cached page of the catalog for the request, memoized on the request for
+    the validators and the view, or None
+    """
+    if not hasattr(request, '_catalog_page'):
+        request._catalog_page = get_tagged(page_key(subject_slug, request.GET.get('cursor')), 'catalog')
+    return request._catalog_page
+
+
+def build_page(content):
+    """
+    A rendered page with its validators
+    """
+    return {
+        'content': content,
+        'etag': hashlib.sha256(content).hexdigest(),
+        'modified': timezone.now(),
+    }
+
+
+def set_page(request, subject_slug, page, versions):
+    set_tagged(page_key(subject_slug, request.GET.get('cursor')), page, versions, settings.CATALOG_PAGE_CACHE_TIMEOUT)
@@ -0,0 +1,134 @@
+"""
+Validators of the catalog pages and API resources for conditional GET.
+
+Each validator reads the ``modified_at`` of the rows a response shows, and
+the counters or orders that change without touching it, with one or two
+small queries instead of building the response. Catalog pages of anonymous
+visitors take theirs from the page cache, see catalog.py. ``catalog_condition``
+answers 304 when they match the request and sets the Cache-Control of the
+response: public for anonymous users so that a front cache can keep it,
+private and revalidated on every use otherwise.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.crypto import salted_hmac
+from django.views.decorators.http import condition
+
+from .catalog import get_page
+from .models import Subject, Course, Module
+
+
+def _etag(*parts):
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _viewer(request):
+    """
+    What of the viewer a page shows: whether a user is logged in and, with
+    the CSRF token of its forms, the CSRF secret, which login rotates
+    """
+    if not request.user.is_authenticated:
+        return 'anonymous'
+    csrf_secret = request.META.get('CSRF_COOKIE') or ''
+    return '{}:{}'.format(request.user.pk, salted_hmac('catalog-etag', csrf_secret).hexdigest()[:16])
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def course_list_validators(request, subject=None):
+    if not request.user.is_authenticated:
+        # cached pages carry their validators, a miss renders the page
+        # which sets them
+        page = get_page(request, subject)
+        return (page['etag'], page['modified']) if page else (None, None)
+    courses = Course.objects.all()
+    if subject:
+        courses = courses.filter(subject__slug=subject)
+    # the pages show the names of the instructors, which save updated_at
+    course_state = courses.aggregate(
+        modified=Max('modified_at'), count=Count('id'), modules=Sum('total_modules'),
+        owners_modified=Max('owner__updated_at'),
+    )
+    subject_state = Subject.objects.aggregate(
+        modified=Max('modified_at'), count=Count('id'), courses=Sum('total_courses')
+    )
+    etag = _etag(
+        'course_list', _viewer(request), subject, *course_state.values(), *subject_state.values()
+    )
+    return etag, _latest(course_state['modified'], course_state['owners_modified'], subject_state['modified'])
+
+
+def course_detail_validators(request, slug):
+    state = Course.objects.filter(slug=slug).values(
+        'pk', 'modified_at', 'total_modules', 'subject__modified_at',
+        'owner__first_name', 'owner__last_name', 'owner__updated_at',
+    ).first()
+    if state is None:
+        return None, None
+    etag = _etag('course_detail', _viewer(request), *state.values())
+    return etag, _latest(state['modified_at'], state['subject__modified_at'], state['owner__updated_at'])
+
+
+def subject_validators(request, pk):
+    if not str(pk).isdigit():
+        return None, None
+    modified = Subject.objects.filter(pk=pk).values_list('modified_at', flat=True).first()
+    if modified is None:
+        return None, None
+    return _etag('subject', pk, modified), modified
+
+
+def course_resource_validators(request, pk):
+    if not str(pk).isdigit():
+        return None, None
+    modified = Course.objects.filter(pk=pk).values_list('modified_at', flat=True).first()
+    if modified is None:
+        return None, None
+    # reorders change the module list without touching modified_at
+    modules = list(Module.objects.filter(course_id=pk).order_by('order').values_list('pk', 'modified_at'))
+    etag = _etag('course', pk, modified, *modules)
+    return etag, _latest(modified, *(module_modified for _, module_modified in modules))
+
+
+def catalog_condition(validators):
+    """
+    condition() with the ETag and Last-Modified returned together by
+    ``validators(request, *args, **kwargs)``, and the Cache-Control of the
+    catalog. Responses to logged in users only get an ETag, which covers
+    what the page shows of them.
+    """
+    def get_validators(request, *args, **kwargs):
+        if not hasattr(request, '_catalog_validators'):
+            request._catalog_validators = validators(request, *args, **kwargs)
+        return request._catalog_validators
+
+    def etag_func(request, *args, **kwargs):
+        return get_validators(request, *args, **kwargs)[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        return get_validators(request, *args, **kwargs)[1]
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+                if request.user.is_authenticated:
+                    patch_cache_control(response, private=True, no_cache=True)
+                else:
+                    patch_cache_control(response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+                patch_vary_headers(response, ['Cookie', 'Authorization'])
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,46 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Subject, Course, Module
+
+
+def _count(queryset, field):
+    """
+    Correlated ``COUNT(*)`` of ``queryset`` rows whose ``field`` points to the
+    outer row
+    """
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('*')).values('total')
+    ), Value(0))
+
+
+def increment(model, pk, field, delta):
+    """
+    Atomically add ``delta`` to a counter column, never going below zero
+    """
+    model.objects.filter(pk=pk).update(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def refresh_subject_counters(subject_ids=None):
+    subjects = Subject.objects.all()
+    if subject_ids is not None:
+        subjects = subjects.filter(pk__in=subject_ids)
+    return subjects.update(total_courses=_count(Course.objects.all(), 'subject'))
+
+
+def refresh_course_counters(course_ids=None):
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    return courses.update(
+        total_modules=_count(Module.objects.all(), 'course'),
+        total_students=_count(Course.students.through.objects.all(), 'course'),
+    )
+
+
+def refresh_enrollment_counters(course_ids):
+    return Course.objects.filter(pk__in=course_ids).update(
+        total_students=_count(Course.students.through.objects.all(), 'course')
+    )
@@ -1,38 +1,108 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from functools import reduce
+import operator
+
+from django.db import models, connections, router
+from django.db.models import ExpressionWrapper, Max, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+
+# gap between the orders of consecutive modules and contents
+ORDER_STEP = 1024
 
 
 class OrderField(models.PositiveIntegerField):
     """
     OrderField model
     """
-    def __init__(self, for_fields=None, *args, **kwargs):
+    def __init__(self, for_fields=None, step=1, *args, **kwargs):
         """
         __init__ method
         for fields: The fields to be used for ordering
+        step: The gap left between consecutive values, so that an item can
+        later be moved between two others by rewriting only its own value
         """
         self.for_fields = for_fields
+        self.step = step
         super().__init__(*args, **kwargs)
 
+    @property
+    def db_returning(self):
+        # the value is computed by the INSERT itself, read it back from the
+        # same statement on backends that support RETURNING
+        return True
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_save.connect(self._refresh_value, sender=cls)
+
+    def _refresh_value(self, sender, instance, **kwargs):
+        # backends without RETURNING leave the allocation expression behind
+        if hasattr(getattr(instance, self.attname), 'resolve_expression'):
+            instance.refresh_from_db(fields=[self.attname])
+
+    def get_scope(self, model_instance):
+        """
+        Lookup of the rows sharing the "for_fields" values of the instance
+        """
+        attnames = (self.model._meta.get_field(name).attname for name in self.for_fields or ())
+        return {attname: getattr(model_instance, attname) for attname in attnames}
+
+    def lock_scope(self, scopes, using):
+        """
+        Lock the parent rows of the given scopes until the end of the
+        transaction so concurrent allocations in a scope are serialized
+        """
+        connection = connections[using]
+        if not (connection.features.has_select_for_update and connection.in_atomic_block):
+            return
+        for name in self.for_fields or ():
+            field = self.model._meta.get_field(name)
+            if not field.is_relation:
+                continue
+            pks = {scope[field.attname] for scope in scopes}
+            list(
+                field.related_model._base_manager.using(using)
+                .select_for_update().filter(pk__in=pks).values_list('pk', flat=True)
+            )
+
+    def last_values(self, scopes, using):
+        """
+        Highest order of each scope with rows, scopes being tuples of
+        (attname, value) pairs as built from get_scope()
+        """
+        qs = self.model._base_manager.using(using).order_by()
+        attnames = [attname for attname, _ in scopes[0]] if scopes else []
+        if not attnames:
+            last = qs.aggregate(last=Max(self.attname))['last']
+            return {} if last is None else {(): last}
+        rows = qs.filter(
+            reduce(operator.or_, (Q(**dict(scope)) for scope in scopes))
+        ).values(*attnames).annotate(last=Max(self.attname))
+        return {tuple((attname, row[attname]) for attname in attnames): row['last'] for row in rows}
+
+    def next_value(self, scope):
+        """
+        Expression evaluating to the order following the last row of a scope
+        """
+        last = self.model._base_manager.filter(**scope).order_by(
+            f"-{self.attname}"
+        ).values(self.attname)[:1]
+        return ExpressionWrapper(
+            Coalesce(Subquery(last), Value(0)) + Value(self.step),
+            output_field=models.PositiveIntegerField()
+        )
+
     def pre_save(self, model_instance, add):
         """
         pre_save method
         """
         if getattr(model_instance, self.attname) is None:
-            # No current value
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    # Filter by objects with the same field values
-                    # for the fields in "for_fields"
-                    query = {field: getattr(model_instance, field) for field in self.for_fields}
-                    qs = qs.filter(**query)
-                # Get the order of the last item
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 0
+            # No current value, allocate it in the INSERT itself
+            scope = self.get_scope(model_instance)
+            self.lock_scope([scope], router.db_for_write(self.model, instance=model_instance))
+            value = self.next_value(scope)
             setattr(model_instance, self.attname, value)
             return value
         else:
-            return super().pre_save(model_instance, add)
\ No newline at end of file
+            return super().pre_save(model_instance, add)
@@ -0,0 +1,136 @@
+import mimetypes
+import os
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .storage import content_storage
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    Read only ``length`` bytes of a file from ``start``. The file descriptor
+    is exposed so that a WSGI server's file wrapper can still send the range
+    with sendfile(), from the current offset and for Content-Length bytes.
+    """
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single ``bytes=`` range, end inclusive, None when the
+    header should be ignored and False when the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # malformed or multiple ranges, answer with the whole file
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range, the last bytes of the file
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def file_etag(name, size, modified):
+    if content_storage.is_hashed_name(name):
+        # the name is the hash of the bytes
+        return quote_etag(os.path.splitext(os.path.basename(name))[0])
+    return quote_etag('{:x}-{:x}'.format(size, int(modified.timestamp())))
+
+
+def range_applies(request, etag, modified):
+    """
+    Whether the Range header is to be honoured, following If-Range
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(modified.timestamp()) <= if_range_date
+
+
+def serve_file(request, name, filename, storage=content_storage, as_attachment=True):
+    """
+    Response serving a stored file as an attachment named ``filename``, or
+    inline, with validators, conditional and single Range requests, or an
+    empty response handing the file over to the front proxy when
+    SENDFILE_BACKEND is set
+    """
+    path = storage.path(name)
+    stat = os.stat(path)
+    modified = datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+    etag = file_etag(name, stat.st_size, modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is not None:
+        response['ETag'] = etag
+        return response
+
+    backend = settings.SENDFILE_BACKEND
+    if backend:
+        # the proxy serves the bytes, Range requests included
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            response['X-Accel-Redirect'] = settings.SENDFILE_URL_PREFIX + name
+        else:
+            response['X-Sendfile'] = path
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    else:
+        file = storage.open(name, 'rb')
+        byte_range = None
+        if 'HTTP_RANGE' in request.META and range_applies(request, etag, modified):
+            byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+        if byte_range is False:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range is None:
+            response = FileResponse(file, as_attachment=as_attachment, filename=filename)
+        else:
+            start, end = byte_range
+            response = FileResponse(
+                RangeFile(file, start, end - start + 1), as_attachment=as_attachment, filename=filename
+            )
+            response.status_code = 206
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,58 @@
+import json
+
+from django.db.models import Prefetch
+from rest_framework.utils.encoders import JSONEncoder
+
+from .api.serializers import CourseSerializer, CourseWithModulesSerializer, CourseWithContentsSerializer
+from .managers import prefetch_contents
+from .models import Course, Module
+
+EXPORT_MODES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+EXPANSIONS = (None, 'modules', 'contents')
+
+
+def export_courses(expand=None, chunk_size=500):
+    """
+    Serialized courses, read from the database ``chunk_size`` rows at a time
+    with their related rows prefetched per chunk, so memory use does not
+    depend on the size of the catalog
+    """
+    queryset = Course.objects.order_by('pk')
+    if expand == 'contents':
+        queryset = queryset.prefetch_related(prefetch_contents('modules__contents'))
+        serializer_class = CourseWithContentsSerializer
+    elif expand == 'modules':
+        queryset = queryset.prefetch_related('modules')
+        serializer_class = CourseWithModulesSerializer
+    else:
+        queryset = queryset.prefetch_related(
+            Prefetch('modules', queryset=Module.objects.only('id', 'course_id'))
+        )
+        serializer_class = CourseSerializer
+    for course in queryset.iterator(chunk_size=chunk_size):
+        yield serializer_class(course).data
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, cls=JSONEncoder) + '\n'
+
+
+def iter_json(records):
+    """
+    A JSON array emitted one element at a time
+    """
+    yield '['
+    separator = '\n'
+    for record in records:
+        yield separator + json.dumps(record, cls=JSONEncoder)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def stream_courses(mode='ndjson', expand=None, chunk_size=500):
+    records = export_courses(expand=expand, chunk_size=chunk_size)
+    return iter_ndjson(records) if mode == 'ndjson' else iter_json(records)
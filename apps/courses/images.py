@@ -0,0 +1,104 @@
+import os
+import tempfile
+
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+
+from .storage import content_storage
+
+# widths of the resized copies offered through srcset
+IMAGE_WIDTHS = (320, 768, 1280)
+# Pillow format of the fallback derivative of each resizable format
+DERIVATIVE_FORMATS = {
+    'JPEG': 'JPEG',
+    'PNG': 'PNG',
+    'WEBP': 'PNG',
+}
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+}
+
+
+def image_format(file):
+    """
+    Pillow format of an image file, e.g. 'JPEG', or '' when unreadable
+    """
+    try:
+        file.seek(0)
+        with PILImage.open(file) as image:
+            return image.format or ''
+    except (OSError, UnidentifiedImageError):
+        return ''
+    finally:
+        file.seek(0)
+
+
+def fallback_extension(item):
+    return EXTENSIONS[DERIVATIVE_FORMATS[item.format]]
+
+
+def derivative_name(name, width, extension):
+    return 'derivatives/{}-{}w.{}'.format(os.path.splitext(name)[0], width, extension)
+
+
+def derivative_widths(item):
+    """
+    Widths of the derivatives worth offering for an image, narrower than it
+    """
+    if item.format not in DERIVATIVE_FORMATS or not item.width:
+        return []
+    return [width for width in IMAGE_WIDTHS if width < item.width]
+
+
+def generate_derivative(item, width, extension):
+    """
+    Write a copy of the image resized to ``width`` in the format of
+    ``extension`` next to the originals, replacing the file atomically
+    """
+    name = derivative_name(item.image.name, width, extension)
+    path = content_storage.path(name)
+    with item.image.open('rb') as original, PILImage.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        if width < image.width:
+            height = max(round(image.height * width / image.width), 1)
+            image = image.resize((width, height), PILImage.LANCZOS)
+        pil_format = 'WEBP' if extension == 'webp' else DERIVATIVE_FORMATS[item.format]
+        if pil_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(prefix='.derivative-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                image.save(temp_file, pil_format, quality=80, optimize=True)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    return name
+
+
+def get_derivative(item, width, extension):
+    """
+    Storage name of a derivative of the image, generated on first use
+    """
+    name = derivative_name(item.image.name, width, extension)
+    if not content_storage.exists(name):
+        generate_derivative(item, width, extension)
+    return name
+
+
+def delete_derivatives(name):
+    directory, prefix = os.path.split(derivative_name(name, 0, '')[:-len('0w.')])
+    if not content_storage.exists(directory):
+        return
+    for filename in content_storage.listdir(directory)[1]:
+        if filename.startswith(prefix):
+            content_storage.delete(f'{directory}/{filename}')
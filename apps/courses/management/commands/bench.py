@@ -0,0 +1,91 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+
+from ...benchmarks import compare, measure, scenarios, seed_catalog
+
+BENCH_SETTINGS = {
+    # a private cache, the shared one must not serve or receive bench entries
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}},
+    # the contents API authenticates every request with Basic credentials,
+    # keep the password hashing out of the figures as the test runner does
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalog in a test database and measure query counts, latency and memory of "
+        "the main views, failing when the stored baseline is exceeded"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subjects', type=int, default=5)
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--modules', type=int, default=8, help="Modules per course")
+        parser.add_argument('--contents', type=int, default=10, help="Contents per module")
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--enrollments', type=int, default=5, help="Courses per student")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help="Scenario to run, all by default, can be repeated")
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'bench_baseline.json'))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Store the results as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed latency and memory increase over the baseline, as a fraction")
+        parser.add_argument('--query-tolerance', type=int, default=0,
+                            help="Allowed extra queries over the baseline")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=[])
+        try:
+            with override_settings(**BENCH_SETTINGS):
+                results = self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+                baseline_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(f"No baseline at {options['baseline']}, store one with --update-baseline")
+            return
+        with open(options['baseline']) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, options['tolerance'], options['query_tolerance'])
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regression against the baseline"))
+
+    def run(self, options):
+        catalog = seed_catalog(
+            subjects=options['subjects'], courses=options['courses'], modules=options['modules'],
+            contents=options['contents'], students=options['students'], enrollments=options['enrollments'],
+        )
+        available = scenarios(catalog)
+        names = options['scenarios'] or list(available)
+        unknown = set(names) - set(available)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        results = {}
+        self.stdout.write(f"{'scenario':<24} {'queries':>8} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>10}")
+        for name in names:
+            result = results[name] = measure(available[name], options['iterations'], options['warmup'])
+            self.stdout.write(
+                f"{name:<24} {result['queries']:>8} {result['p50_ms']:>9} {result['p99_ms']:>9} "
+                f"{result['peak_kib']:>10}"
+            )
+        return results
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...archive import export_course_archive
+from ...models import Course
+
+
+class Command(BaseCommand):
+    help = "Write the archive of a course, its modules, contents and media, to a zip file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help="Id or slug of the course")
+        parser.add_argument('--output', '-o', help="Zip file to write, <slug>.zip by default")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['course']} if options['course'].isdigit() else {'slug': options['course']}
+        course = Course.objects.select_related('subject').filter(**lookup).first()
+        if course is None:
+            raise CommandError(f"No course {options['course']}")
+        output = options['output'] or f'{course.slug}.zip'
+        with open(output, 'wb') as fileobj:
+            count = export_course_archive(course, fileobj, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} contents of {course} to {output}"))
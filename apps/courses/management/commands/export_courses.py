@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ...export import EXPORT_MODES, EXPANSIONS, stream_courses
+
+
+class Command(BaseCommand):
+    help = "Stream the whole course catalog as NDJSON or JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=list(EXPORT_MODES), default='ndjson')
+        parser.add_argument('--expand', choices=[expand for expand in EXPANSIONS if expand])
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--output', '-o', help="File to write to, stdout by default")
+
+    def handle(self, *args, **options):
+        chunks = stream_courses(options['mode'], options['expand'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
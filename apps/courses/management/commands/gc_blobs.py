@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ...blobs import collect_garbage, rebuild_references
+
+
+class Command(BaseCommand):
+    help = "Delete the stored files of File and Image items that are no longer referenced"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Hours a file stays unreferenced before it is deleted")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recount the references of every blob first")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f"Recounted the references of {rebuild_references()} blobs")
+        deleted, size = collect_garbage(
+            grace=timedelta(hours=options['grace_hours']), dry_run=options['dry_run']
+        )
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} files, {size} bytes"))
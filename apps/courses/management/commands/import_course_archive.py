@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ....users.models import User
+from ...archive import ArchiveError, import_course_archive
+from ...models import Subject
+
+
+class Command(BaseCommand):
+    help = "Create a course from an archive written by export_course_archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help="Zip file to import")
+        parser.add_argument('--owner', required=True, help="Email of the instructor owning the new course")
+        parser.add_argument('--subject', help="Slug of the subject, the subject of the archive by default")
+        parser.add_argument('--slug', help="Slug of the new course, the slug of the archive by default")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        owner = User.objects.filter(email=options['owner']).first()
+        if owner is None:
+            raise CommandError(f"No user {options['owner']}")
+        subject = None
+        if options['subject']:
+            subject = Subject.objects.filter(slug=options['subject']).first()
+            if subject is None:
+                raise CommandError(f"No subject {options['subject']}")
+        start = time.perf_counter()
+        try:
+            with open(options['archive'], 'rb') as fileobj:
+                course = import_course_archive(
+                    fileobj, owner, subject=subject, slug=options['slug'], batch_size=options['batch_size']
+                )
+        except ArchiveError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {course} as {course.slug} in {time.perf_counter() - start:.1f}s"
+        ))
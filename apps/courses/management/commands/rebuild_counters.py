@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...counters import refresh_subject_counters, refresh_course_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized subject and course counters from scratch"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            subjects = refresh_subject_counters()
+            courses = refresh_course_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt counters of {subjects} subjects and {courses} courses"
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from ...models import SearchEntry
+from ...search import SEARCH_MODELS, index_objects
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of courses, modules and texts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        with transaction.atomic():
+            SearchEntry.objects.all().delete()
+            for model in SEARCH_MODELS:
+                chunk, total = [], 0
+                for obj in model.objects.order_by('pk').iterator(chunk_size=chunk_size):
+                    chunk.append(obj)
+                    if len(chunk) == chunk_size:
+                        index_objects(chunk)
+                        total += len(chunk)
+                        chunk = []
+                index_objects(chunk)
+                total += len(chunk)
+                self.stdout.write(f"Indexed {total} {model._meta.verbose_name_plural.lower()}")
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute("INSERT INTO search_entries_fts(search_entries_fts) VALUES ('rebuild')")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,169 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Prefetch
+from django.dispatch import Signal
+
+from .custom_fields import OrderField
+
+# sent after bulk_append() inserted rows, with the list of new objects
+post_bulk_append = Signal()
+# sent after reorder() changed orders, with the pks of the updated rows
+post_reorder = Signal()
+
+
+def _increasing_run(values):
+    """
+    Indexes of a longest strictly increasing subsequence of ``values``
+    """
+    tails, tail_indexes, previous = [], [], [None] * len(values)
+    for index, value in enumerate(values):
+        position = bisect_left(tails, value)
+        if position:
+            previous[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(value)
+            tail_indexes.append(index)
+        else:
+            tails[position] = value
+            tail_indexes[position] = index
+    run, index = set(), tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        run.add(index)
+        index = previous[index]
+    return run
+
+
+def plan_orders(current, step):
+    """
+    New orders for rows whose current orders are ``current``, listed in the
+    wanted sequence. The longest already sorted run keeps its values and the
+    other rows are placed in the gaps around it, so moving one row rewrites
+    one value. Without room left the whole sequence is spread by ``step``.
+    """
+    keep = _increasing_run(current)
+    orders = list(current)
+    index = 0
+    while index < len(orders):
+        if index in keep:
+            index += 1
+            continue
+        end = index
+        while end < len(orders) and end not in keep:
+            end += 1
+        low = orders[index - 1] if index else -1
+        count = end - index
+        if end == len(orders):
+            high = low + (count + 1) * step
+        else:
+            high = orders[end]
+        if high - low - 1 < count:
+            return [(position + 1) * step for position in range(len(orders))]
+        for offset in range(count):
+            orders[index + offset] = low + (offset + 1) * (high - low) // (count + 1)
+        index = end
+    return orders
+
+
+class OrderedQuerySet(models.QuerySet):
+    """
+    OrderedQuerySet for models with an OrderField
+    """
+    def get_order_field(self):
+        return next(field for field in self.model._meta.concrete_fields if isinstance(field, OrderField))
+
+    def bulk_append(self, objs, batch_size=None):
+        """
+        Insert new rows after the last row of their "for_fields" scope with
+        contiguous orders. The scopes are locked and their last order read
+        with one query each, then all rows go in with a single INSERT.
+        """
+        objs = list(objs)
+        if not objs:
+            return objs
+        field = self.get_order_field()
+        scopes = defaultdict(list)
+        for obj in objs:
+            scopes[tuple(field.get_scope(obj).items())].append(obj)
+        with transaction.atomic(using=self.db):
+            field.lock_scope([dict(scope) for scope in scopes], self.db)
+            last_values = field.last_values(list(scopes), self.db)
+            for scope, scope_objs in scopes.items():
+                start = last_values.get(scope, 0) + field.step
+                for offset, obj in enumerate(scope_objs):
+                    setattr(obj, field.attname, start + offset * field.step)
+            objs = self.bulk_create(objs, batch_size=batch_size)
+            post_bulk_append.send(sender=self.model, objs=objs, using=self.db)
+        return objs
+
+    def reorder(self, positions):
+        """
+        Apply a reorder given as ``{pk: position}`` in one transaction, the
+        position being the 0-based index of the row in its "for_fields" scope.
+        Only rows of this queryset are considered, so a filtered queryset
+        validates ownership of the whole set at once; DoesNotExist is raised
+        when some pk falls outside of it, ValueError when the rows do not
+        share one scope. Rows left out of the map keep their relative order
+        around the moved ones. Changed orders are written with a single bulk
+        UPDATE. Return the number of updated rows.
+        """
+        try:
+            positions = {int(pk): int(position) for pk, position in positions.items()}
+        except (TypeError, ValueError):
+            raise ValueError("Ids and positions must be integers") from None
+        field = self.get_order_field()
+        attnames = [self.model._meta.get_field(name).attname for name in field.for_fields or ()]
+        with transaction.atomic(using=self.db):
+            listed = list(
+                self.select_for_update(of=('self',)).filter(pk__in=positions)
+                .order_by().values_list('pk', *attnames)
+            )
+            if len(listed) != len(positions):
+                raise self.model.DoesNotExist("Some objects do not exist or are not accessible")
+            scopes = {row[1:] for row in listed}
+            if len(scopes) > 1:
+                raise ValueError("Objects must share the same {}".format(", ".join(field.for_fields)))
+            if not scopes:
+                return 0
+            # the orders are planned against every row of the scope
+            rows = list(
+                self.model._base_manager.using(self.db).select_for_update()
+                .filter(**dict(zip(attnames, scopes.pop())))
+                .order_by(field.attname, 'pk').values_list('pk', field.attname)
+            )
+            current = dict(rows)
+            sequence = [pk for pk, _ in rows if pk not in positions]
+            for pk in sorted(positions, key=lambda pk: (positions[pk], current[pk])):
+                sequence.insert(min(max(positions[pk], 0), len(sequence)), pk)
+            orders = plan_orders([current[pk] for pk in sequence], field.step)
+            changed = [
+                self.model(pk=pk, **{field.attname: new})
+                for pk, new in zip(sequence, orders) if new != current[pk]
+            ]
+            if changed:
+                self.model._base_manager.using(self.db).bulk_update(changed, [field.attname])
+                post_reorder.send(sender=self.model, pks=[obj.pk for obj in changed], using=self.db)
+        return len(changed)
+
+
+class ContentQuerySet(OrderedQuerySet):
+    """
+    ContentQuerySet
+    """
+    def with_items(self):
+        """
+        Load the generic ``item`` of every content with one query per
+        concrete item model (text, video, image, file) instead of one per row
+        """
+        return self.prefetch_related('item')
+
+
+def prefetch_contents(lookup='contents'):
+    """
+    Prefetch object for a ``contents`` relation with their items loaded,
+    e.g. ``Module.objects.prefetch_related(prefetch_contents())`` or
+    ``Course.objects.prefetch_related(prefetch_contents('modules__contents'))``
+    """
+    from .models import Content
+    return Prefetch(lookup, queryset=Content.objects.with_items())
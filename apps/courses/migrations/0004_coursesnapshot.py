@@ -0,0 +1,28 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_course_students'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSnapshot',
+            fields=[
+                ('course', models.OneToOneField(help_text='Course the snapshot belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='courses.course', verbose_name='Course')),
+                ('payload', models.TextField(help_text='Serialized course contents', verbose_name='Payload')),
+                ('etag', models.CharField(help_text='Strong validator of the payload', max_length=64, verbose_name='ETag')),
+                ('built_at', models.DateTimeField(auto_now=True, help_text='Date and time the snapshot was built', verbose_name='Built')),
+            ],
+            options={
+                'verbose_name': 'Course snapshot',
+                'verbose_name_plural': 'Course snapshots',
+                'db_table': 'course_snapshots',
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('*')).values('total')
+    ), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Subject = apps.get_model('courses', 'Subject')
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    Subject.objects.update(total_courses=count(Course.objects.all(), 'subject'))
+    Course.objects.update(
+        total_modules=count(Module.objects.all(), 'course'),
+        total_students=count(Course.students.through.objects.all(), 'course'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_coursesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='total_modules',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of modules in the course', verbose_name='Total modules'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='total_students',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of students enrolled in the course', verbose_name='Total students'),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='total_courses',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of courses in the subject', verbose_name='Total courses'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
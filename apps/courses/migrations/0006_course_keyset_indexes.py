@@ -0,0 +1,25 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='course',
+            options={'ordering': ['-created', 'id'], 'verbose_name': 'Course', 'verbose_name_plural': 'Courses'},
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['-created', 'id'], name='courses_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['subject', '-created', 'id'], name='courses_subject_created_id_idx'),
+        ),
+    ]
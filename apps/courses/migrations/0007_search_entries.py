@@ -0,0 +1,96 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRESQL_INDEX = [
+    """
+    ALTER TABLE search_entries ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX search_entries_vector_idx ON search_entries USING GIN (search_vector)",
+]
+
+SQLITE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE search_entries_fts USING fts5(
+        title, body, content='search_entries', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER search_entries_ai AFTER INSERT ON search_entries BEGIN
+        INSERT INTO search_entries_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_entries_ad AFTER DELETE ON search_entries BEGIN
+        INSERT INTO search_entries_fts(search_entries_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_entries_au AFTER UPDATE ON search_entries BEGIN
+        INSERT INTO search_entries_fts(search_entries_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO search_entries_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS search_entries_au",
+    "DROP TRIGGER IF EXISTS search_entries_ad",
+    "DROP TRIGGER IF EXISTS search_entries_ai",
+    "DROP TABLE IF EXISTS search_entries_fts",
+]
+
+
+def create_index(apps, schema_editor):
+    statements = {
+        'postgresql': POSTGRESQL_INDEX,
+        'sqlite': SQLITE_INDEX,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    # the PostgreSQL column and index go away with the table
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('courses', '0006_course_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(help_text='Title of the document', max_length=200, verbose_name='Title')),
+                ('body', models.TextField(blank=True, help_text='Indexed text of the document', verbose_name='Body')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('course', models.ForeignKey(blank=True, help_text='Course the document belongs to', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='courses.course', verbose_name='Course')),
+            ],
+            options={
+                'verbose_name': 'Search entry',
+                'verbose_name_plural': 'Search entries',
+                'db_table': 'search_entries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id'), name='search_entries_object_uniq'),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:48
+
+import apps.courses.storage
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    """
+    Blobs for the files uploaded before the content addressed storage,
+    they keep their original names
+    """
+    Blob = apps.get_model('courses', 'Blob')
+    counts = {}
+    for model_name, field in (('File', 'file'), ('Image', 'image')):
+        model = apps.get_model('courses', model_name)
+        for name in model.objects.exclude(**{field: ''}).values_list(field, flat=True):
+            counts[name] = counts.get(name, 0) + 1
+    Blob.objects.bulk_create(
+        [Blob(name=name, refcount=refcount) for name, refcount in counts.items()], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_search_entries'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(help_text='File', max_length=255, storage=apps.courses.storage.get_content_storage, upload_to='files', verbose_name='File'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.FileField(help_text='Image', max_length=255, storage=apps.courses.storage.get_content_storage, upload_to='images', verbose_name='Image'),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(help_text='Name of the file in the storage', max_length=255, primary_key=True, serialize=False, verbose_name='Name')),
+                ('refcount', models.PositiveIntegerField(default=0, help_text='Number of items using the file', verbose_name='References')),
+                ('unreferenced_since', models.DateTimeField(blank=True, help_text='When the last reference was removed, the file is collected after a grace period', null=True, verbose_name='Unreferenced since')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Blob',
+                'verbose_name_plural': 'Blobs',
+                'db_table': 'blobs',
+                'indexes': [models.Index(fields=['refcount', 'unreferenced_since'], name='blobs_unreferenced_idx')],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:49
+
+import apps.courses.storage
+from django.db import migrations, models
+
+
+def read_metadata(apps, schema_editor):
+    """
+    Dimensions and format of the images uploaded before they were recorded.
+    Unreadable files get a width and height of 0, so that loading an Image
+    does not try to read them again.
+    """
+    from PIL import Image as PILImage
+
+    from apps.courses.storage import content_storage
+
+    Image = apps.get_model('courses', 'Image')
+    images = []
+    for pk, name in Image.objects.filter(width__isnull=True).values_list('pk', 'image'):
+        image = Image(pk=pk, width=0, height=0, format='')
+        try:
+            with content_storage.open(name, 'rb') as file, PILImage.open(file) as pil_image:
+                image.width, image.height = pil_image.size
+                image.format = pil_image.format or ''
+        except (OSError, ValueError):
+            pass
+        images.append(image)
+    Image.objects.bulk_update(images, ['width', 'height', 'format'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='format',
+            field=models.CharField(blank=True, editable=False, help_text='Format of the image, e.g. JPEG', max_length=10, verbose_name='Format'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.PositiveIntegerField(editable=False, help_text='Height of the image in pixels', null=True, verbose_name='Height'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.PositiveIntegerField(editable=False, help_text='Width of the image in pixels', null=True, verbose_name='Width'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(height_field='height', help_text='Image', max_length=255, storage=apps.courses.storage.get_content_storage, upload_to='images', verbose_name='Image', width_field='width'),
+        ),
+        migrations.RunPython(read_metadata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:18
+
+import apps.courses.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='course',
+            name='slug',
+            field=models.SlugField(help_text='Slug of the course', max_length=200, unique=True, validators=[apps.courses.models.validate_course_slug], verbose_name='Slug'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_course_slug_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='contents_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Incremented by every change of the modules and contents of the course', verbose_name='Contents version'),
+        ),
+        migrations.AddField(
+            model_name='coursesnapshot',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Contents version of the course the snapshot was built from', verbose_name='Version'),
+        ),
+    ]
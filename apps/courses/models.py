@@ -1,10 +1,16 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.template.loader import render_to_string
+from django.urls import reverse
 
 from ..users.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
-from .custom_fields import OrderField
+from .custom_fields import OrderField, ORDER_STEP
+from .managers import OrderedQuerySet, ContentQuerySet
+from .cache import get_rendered_item
+from .images import image_format, derivative_widths, fallback_extension
+from .storage import get_content_storage
 
 
 # Create your models here.
@@ -24,7 +30,35 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
-class Subject(TimeStampedModel):
+class AtomicSaveMixin:
+    """
+    Run saves in a transaction, together with the work of the post_save
+    receivers (counters) and the order allocation lock of OrderField
+    """
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class CounterFieldsMixin(AtomicSaveMixin):
+    """
+    Mixin for models holding denormalized counters.
+    The ``counter_fields`` of an existing row are never written back from a
+    possibly stale instance, only through F() updates.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (self.counter_fields and not self._state.adding
+                and not kwargs.get('force_insert') and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Subject(CounterFieldsMixin, TimeStampedModel):
     title = models.CharField(
         max_length=200,
         verbose_name="Title",
@@ -41,6 +75,14 @@ class Subject(TimeStampedModel):
         help_text="Description of the subject",
         blank=True, null=True
     )
+    total_courses = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Total courses",
+        help_text="Number of courses in the subject"
+    )
+
+    counter_fields = ("total_courses",)
 
     class Meta:
         verbose_name = "Subject"
@@ -50,7 +92,16 @@ class Subject(TimeStampedModel):
         return self.title
 
 
-class Course(TimeStampedModel):
+# paths of courses.urls that the URL of a course with the slug would shadow
+RESERVED_COURSE_SLUGS = ('mine', 'create', 'search')
+
+
+def validate_course_slug(value):
+    if value in RESERVED_COURSE_SLUGS:
+        raise ValidationError('"%(value)s" is reserved, choose another slug.', params={'value': value})
+
+
+class Course(CounterFieldsMixin, TimeStampedModel):
     """
     Course model
     """
@@ -76,6 +127,7 @@ class Course(TimeStampedModel):
     slug = models.SlugField(
         max_length=200,
         unique=True,
+        validators=[validate_course_slug],
         verbose_name="Slug",
         help_text="Slug of the course"
     )
@@ -84,18 +136,42 @@ class Course(TimeStampedModel):
         help_text="Course overview"
     )
     students = models.ManyToManyField(User, related_name="courses_joined", blank=True)
+    total_modules = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Total modules",
+        help_text="Number of modules in the course"
+    )
+    total_students = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Total students",
+        help_text="Number of students enrolled in the course"
+    )
+    contents_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Contents version",
+        help_text="Incremented by every change of the modules and contents of the course"
+    )
+
+    counter_fields = ("total_modules", "total_students", "contents_version")
 
     class Meta:
         verbose_name = "Course"
         verbose_name_plural = "Courses"
         db_table = "courses"
-        ordering = ["-created"]
+        ordering = ["-created", "id"]
+        indexes = [
+            models.Index(fields=["-created", "id"], name="courses_created_id_idx"),
+            models.Index(fields=["subject", "-created", "id"], name="courses_subject_created_id_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
 
-class Module(TimeStampedModel):
+class Module(AtomicSaveMixin, TimeStampedModel):
     """
     Module model
     """
@@ -118,9 +194,12 @@ class Module(TimeStampedModel):
     order = OrderField(
         blank=True,
         for_fields=["course"],
+        step=ORDER_STEP,
         help_text="Order of the module"
     )
 
+    objects = OrderedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Module"
         verbose_name_plural = "Modules"
@@ -131,7 +210,7 @@ class Module(TimeStampedModel):
         return f"{self.order}. {self.title}"
 
 
-class Content(models.Model):
+class Content(AtomicSaveMixin, models.Model):
     """
     Content model
     content_type: The type of the content
@@ -153,9 +232,12 @@ class Content(models.Model):
     order = OrderField(
         blank=True,
         for_fields=["module"],
+        step=ORDER_STEP,
         help_text="Order of the content"
     )
 
+    objects = ContentQuerySet.as_manager()
+
     class Meta:
         ordering = ["order"]
         verbose_name = "Content"
@@ -190,9 +272,9 @@ class BaseItem(TimeStampedModel):
         return self.title
 
     def render(self):
-        return render_to_string(
+        return get_rendered_item(self, lambda: render_to_string(
             f"courses/content/{self._meta.model_name}.html", {'item': self}
-        )
+        ))
 
 
 class Text(BaseItem):
@@ -219,6 +301,8 @@ class File(BaseItem):
     """
     file = models.FileField(
         upload_to="files",
+        storage=get_content_storage,
+        max_length=255,
         verbose_name="File",
         help_text="File"
     )
@@ -236,11 +320,34 @@ class Image(BaseItem):
     """
     Image model to store images
     """
-    image = models.FileField(
+    image = models.ImageField(
         upload_to="images",
+        storage=get_content_storage,
+        max_length=255,
+        width_field="width",
+        height_field="height",
         verbose_name="Image",
         help_text="Image"
     )
+    width = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name="Width",
+        help_text="Width of the image in pixels"
+    )
+    height = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name="Height",
+        help_text="Height of the image in pixels"
+    )
+    format = models.CharField(
+        max_length=10,
+        blank=True,
+        editable=False,
+        verbose_name="Format",
+        help_text="Format of the image, e.g. JPEG"
+    )
 
     class Meta:
         verbose_name = "Image"
@@ -250,6 +357,46 @@ class Image(BaseItem):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            # a new upload, read its format before it is stored
+            self.format = image_format(self.image)
+        super().save(*args, **kwargs)
+
+    def _srcset(self, extension):
+        return ", ".join(
+            "{} {}w".format(
+                reverse('courses:image_derivative', args=[self.pk, width, extension]), width
+            )
+            for width in derivative_widths(self)
+        )
+
+    @property
+    def src(self):
+        """
+        URL of the original, served to the owner and the enrolled students
+        """
+        return reverse('courses:image_file', args=[self.pk])
+
+    @property
+    def srcset(self):
+        """
+        Resized copies of the image in its own format, and the original
+        """
+        if not derivative_widths(self):
+            return ""
+        return "{}, {} {}w".format(self._srcset(fallback_extension(self)), self.src, self.width)
+
+    @property
+    def webp_srcset(self):
+        if not derivative_widths(self):
+            return ""
+        return "{}, {} {}w".format(
+            self._srcset('webp'),
+            reverse('courses:image_derivative', args=[self.pk, self.width, 'webp']),
+            self.width
+        )
+
 
 class Video(BaseItem):
     """
@@ -264,3 +411,125 @@ class Video(BaseItem):
 
     def __str__(self):
         return self.title
+
+
+class CourseSnapshot(models.Model):
+    """
+    CourseSnapshot model
+    Precomputed JSON of a course with its modules and contents, served as is
+    by the contents API while its version is the contents version of the
+    course
+    """
+    course = models.OneToOneField(
+        Course,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="snapshot",
+        verbose_name="Course",
+        help_text="Course the snapshot belongs to"
+    )
+    payload = models.TextField(
+        verbose_name="Payload",
+        help_text="Serialized course contents"
+    )
+    etag = models.CharField(
+        max_length=64,
+        verbose_name="ETag",
+        help_text="Strong validator of the payload"
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Version",
+        help_text="Contents version of the course the snapshot was built from"
+    )
+    built_at = models.DateTimeField(
+        auto_now=True, verbose_name="Built",
+        help_text="Date and time the snapshot was built")
+
+    class Meta:
+        verbose_name = "Course snapshot"
+        verbose_name_plural = "Course snapshots"
+        db_table = "course_snapshots"
+
+    def __str__(self):
+        return f"Snapshot of {self.course_id}"
+
+
+class SearchEntry(models.Model):
+    """
+    SearchEntry model
+    One document of the full-text search index: a course, a module or a
+    text item. The backend specific index (a tsvector column with a GIN
+    index on PostgreSQL, an FTS5 table on SQLite) is created by the
+    migration and kept in sync by the database.
+    """
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+    )
+    object_id = models.PositiveIntegerField()
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name="search_entries",
+        blank=True, null=True,
+        verbose_name="Course",
+        help_text="Course the document belongs to"
+    )
+    title = models.CharField(
+        max_length=200,
+        verbose_name="Title",
+        help_text="Title of the document"
+    )
+    body = models.TextField(
+        blank=True,
+        verbose_name="Body",
+        help_text="Indexed text of the document"
+    )
+
+    class Meta:
+        verbose_name = "Search entry"
+        verbose_name_plural = "Search entries"
+        db_table = "search_entries"
+        constraints = [
+            models.UniqueConstraint(fields=["content_type", "object_id"], name="search_entries_object_uniq"),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class Blob(models.Model):
+    """
+    A file of the content addressed storage with the number of File and
+    Image items referencing it
+    """
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name="Name",
+        help_text="Name of the file in the storage"
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name="References",
+        help_text="Number of items using the file"
+    )
+    unreferenced_since = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Unreferenced since",
+        help_text="When the last reference was removed, the file is collected after a grace period"
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Blob"
+        verbose_name_plural = "Blobs"
+        db_table = "blobs"
+        indexes = [
+            models.Index(fields=["refcount", "unreferenced_since"], name="blobs_unreferenced_idx")
+        ]
+
+    def __str__(self):
+        return self.name
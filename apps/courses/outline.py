@@ -0,0 +1,66 @@
+"""
+Course outlines: a course with its ordered modules, as shown around the
+contents of a module to the students. Outlines are cached per course under
+an invalidation tag, made stale once a change of the course or its modules
+is committed, so that showing a module costs the query of its contents and
+one per item model.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch, prefetch_related_objects
+from learnXpert.db_router import use_primary
+
+from .cache import (
+    get_outline, aget_outline, set_outline, aset_outline, get_outline_versions, aget_outline_versions
+)
+from .managers import prefetch_contents
+from .models import Course, Module
+
+
+def build_course_outline(course_id):
+    """
+    The course with its modules prefetched, or None when it does not exist
+    """
+    # cached for every student, never from a lagging replica
+    with use_primary():
+        return Course.objects.prefetch_related(
+            Prefetch('modules', queryset=Module.objects.order_by('order'))
+        ).filter(pk=course_id).first()
+
+
+def get_course_outline(course_id):
+    course = get_outline(course_id)
+    if course is None:
+        # taken first, a change committed while reading makes the outline stale
+        versions = get_outline_versions(course_id)
+        course = build_course_outline(course_id)
+        if course is not None:
+            set_outline(course_id, course, versions)
+    return course
+
+
+async def aget_course_outline(course_id):
+    course = await aget_outline(course_id)
+    if course is None:
+        versions = await aget_outline_versions(course_id)
+        course = await sync_to_async(build_course_outline)(course_id)
+        if course is not None:
+            await aset_outline(course_id, course, versions)
+    return course
+
+
+def select_module(course, module_id=None):
+    """
+    The module ``module_id`` of an outline, its first module by default,
+    or None
+    """
+    modules = course.modules.all()
+    if module_id is None:
+        return modules[0] if modules else None
+    return next((module for module in modules if str(module.pk) == str(module_id)), None)
+
+
+def load_contents(module):
+    """
+    Load the contents of a module of an outline and their items in bulk
+    """
+    prefetch_related_objects([module], prefetch_contents())
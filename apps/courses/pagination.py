@@ -0,0 +1,101 @@
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """
+    A page of a keyset pagination with the opaque cursors of its neighbours
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CreatedKeysetPaginator:
+    """
+    Keyset pagination over (-created, id), the ordering of Course.
+    Every page is read through the (created, id) index with a seek
+    condition instead of an OFFSET, so deep pages cost as much as the first.
+    """
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @staticmethod
+    def encode_cursor(obj, reverse):
+        position = {'c': obj.created.isoformat(), 'i': obj.pk, 'r': reverse}
+        return urlsafe_base64_encode(force_bytes(json.dumps(position)))
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            position = json.loads(force_str(urlsafe_base64_decode(cursor)))
+            return datetime.fromisoformat(position['c']), int(position['i']), bool(position['r'])
+        except (TypeError, ValueError, KeyError):
+            raise InvalidCursor(cursor)
+
+    def _rows(self, cursor):
+        """
+        Queryset of the rows of the page plus one, and the direction it is
+        read in: None for the first page, True when reading backwards
+        """
+        if not cursor:
+            return self.queryset.order_by('-created', 'id')[:self.per_page + 1], None
+        created, pk, reverse = self.decode_cursor(cursor)
+        if reverse:
+            rows = self.queryset.filter(
+                Q(created__gt=created) | Q(created=created, id__lt=pk)
+            ).order_by('created', '-id')
+        else:
+            rows = self.queryset.filter(
+                Q(created__lt=created) | Q(created=created, id__gt=pk)
+            ).order_by('-created', 'id')
+        return rows[:self.per_page + 1], reverse
+
+    def page(self, cursor=None):
+        rows, reverse = self._rows(cursor)
+        return self._page(list(rows), reverse)
+
+    async def apage(self, cursor=None):
+        rows, reverse = self._rows(cursor)
+        return self._page([row async for row in rows], reverse)
+
+    def _page(self, rows, reverse):
+        more = len(rows) > self.per_page
+        object_list = rows[:self.per_page]
+        if reverse is None:
+            has_next, has_previous = more, False
+        elif reverse:
+            object_list, has_next, has_previous = object_list[::-1], True, more
+        else:
+            has_next, has_previous = more, True
+        if not object_list:
+            return KeysetPage(object_list)
+        return KeysetPage(
+            object_list,
+            next_cursor=self.encode_cursor(object_list[-1], reverse=False) if has_next else None,
+            previous_cursor=self.encode_cursor(object_list[0], reverse=True) if has_previous else None,
+        )
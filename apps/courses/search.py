@@ -0,0 +1,150 @@
+import json
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Q
+
+from .models import Course, Module, Content, Text, SearchEntry
+from .services import EnrollmentService
+
+SEARCH_MODELS = (Course, Module, Text)
+# deepest page of results served, OFFSET reads every row of the pages before
+MAX_SEARCH_PAGE = 10
+
+# texts are only found in the courses of the given ids
+POSTGRESQL_SEARCH = """
+    SELECT id, ts_rank_cd(search_vector, query) AS rank
+    FROM search_entries, websearch_to_tsquery('english', %s) query
+    WHERE search_vector @@ query AND (content_type_id <> %s OR course_id = ANY(%s))
+    ORDER BY rank DESC, id
+    LIMIT %s OFFSET %s
+"""
+
+SQLITE_SEARCH = """
+    SELECT search_entries_fts.rowid, -bm25(search_entries_fts, 10.0, 1.0) AS rank
+    FROM search_entries_fts JOIN search_entries ON search_entries.id = search_entries_fts.rowid
+    WHERE search_entries_fts MATCH %s AND (
+        search_entries.content_type_id <> %s
+        OR search_entries.course_id IN (SELECT value FROM json_each(%s))
+    )
+    ORDER BY bm25(search_entries_fts, 10.0, 1.0), search_entries_fts.rowid
+    LIMIT %s OFFSET %s
+"""
+
+
+def build_entry(obj, text_courses):
+    """
+    Unsaved SearchEntry of a course, module or text, ``text_courses``
+    mapping text ids to the course their content belongs to
+    """
+    if isinstance(obj, Course):
+        course_id, body = obj.pk, obj.overview
+    elif isinstance(obj, Module):
+        course_id, body = obj.course_id, obj.description
+    else:
+        course_id, body = text_courses.get(obj.pk), obj.content
+    return SearchEntry(
+        content_type=ContentType.objects.get_for_model(obj),
+        object_id=obj.pk,
+        course_id=course_id,
+        title=obj.title,
+        body=body or '',
+    )
+
+
+def index_objects(objs):
+    """
+    Add or refresh the search entries of the given objects with one upsert
+    """
+    objs = list(objs)
+    text_ids = [obj.pk for obj in objs if isinstance(obj, Text)]
+    text_courses = {}
+    if text_ids:
+        text_courses = dict(
+            Content.objects.filter(
+                content_type=ContentType.objects.get_for_model(Text), object_id__in=text_ids
+            ).values_list('object_id', 'module__course_id')
+        )
+    entries = [build_entry(obj, text_courses) for obj in objs]
+    if entries:
+        SearchEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['content_type', 'object_id'],
+            update_fields=['course', 'title', 'body'],
+        )
+
+
+def remove_object(obj):
+    SearchEntry.objects.filter(
+        content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk
+    ).delete()
+
+
+def _fts5_query(query):
+    # quote every term so user input cannot use the FTS5 query syntax
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    return ' '.join('"{}"'.format(term) for term in terms)
+
+
+def text_course_ids(user):
+    """
+    Ids of the courses whose texts ``user`` can find, the ones they own or
+    are enrolled in. Courses and modules are public, texts are not.
+    """
+    if not user.is_authenticated:
+        return []
+    owned = Course.objects.filter(owner=user).values_list('pk', flat=True)
+    return sorted(set(owned).union(EnrollmentService.get_course_ids(user)))
+
+
+def search(query, limit, offset=0, course_ids=()):
+    """
+    Ranked search entries matching ``query``, best first, each with a
+    ``rank`` attribute. Texts are only searched in the courses of
+    ``course_ids``.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    text_type = ContentType.objects.get_for_model(Text)
+    course_ids = list(course_ids)
+    if connection.vendor == 'postgresql':
+        sql, params = POSTGRESQL_SEARCH, [query, text_type.pk, course_ids, limit, offset]
+    elif connection.vendor == 'sqlite':
+        match = _fts5_query(query)
+        if match is None:
+            return []
+        sql, params = SQLITE_SEARCH, [match, text_type.pk, json.dumps(course_ids), limit, offset]
+    else:
+        # unindexed fallback for other backends
+        entries = list(
+            SearchEntry.objects.filter(Q(title__icontains=query) | Q(body__icontains=query))
+            .filter(~Q(content_type=text_type) | Q(course_id__in=course_ids))
+            .select_related('course', 'content_type').order_by('id')[offset:offset + limit]
+        )
+        for entry in entries:
+            entry.rank = 0
+        return entries
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ranks = dict(cursor.fetchall())
+    entries = SearchEntry.objects.select_related('course', 'content_type').in_bulk(list(ranks))
+    results = []
+    for pk, rank in ranks.items():
+        if pk in entries:
+            entries[pk].rank = rank
+            results.append(entries[pk])
+    return results
+
+
+def search_page(query, page, page_size, course_ids=()):
+    """
+    Results of the 1-based ``page`` of search() and whether a next page is
+    served, up to MAX_SEARCH_PAGE
+    """
+    entries = search(query, page_size + 1, (page - 1) * page_size, course_ids)
+    return entries[:page_size], len(entries) > page_size and page < MAX_SEARCH_PAGE
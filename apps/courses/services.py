@@ -0,0 +1,199 @@
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed
+
+from learnXpert.db_router import use_primary
+
+from .cache import (
+    get_enrollments, set_enrollments, aget_enrollments, aset_enrollments, get_enrollment_version,
+    aget_enrollment_version
+)
+from .models import Course, Content
+
+
+def _needs_check(read_at):
+    """
+    Whether enrollments read at ``read_at`` are to be checked again before
+    granting access, see ENROLLMENT_VERIFY_AFTER
+    """
+    verify_after = settings.ENROLLMENT_VERIFY_AFTER
+    return bool(verify_after) and time.time() - read_at > verify_after
+
+
+class EnrollmentService:
+    @staticmethod
+    def get_course_ids(user):
+        """
+        Sorted ids of the courses the user is enrolled in, from the cache
+        """
+        if not user.is_authenticated:
+            return []
+        return EnrollmentService._get_enrollments(user.pk)[1]
+
+    @staticmethod
+    def _get_enrollments(user_id):
+        entry = get_enrollments(user_id)
+        if entry is None:
+            entry = time.time(), EnrollmentService.refresh_course_ids(user_id)
+        return entry
+
+    @staticmethod
+    def refresh_course_ids(user_id):
+        # taken first, a change committed while reading makes the set stale
+        version = get_enrollment_version(user_id)
+        # cached for every request of the user, a lagging replica would keep
+        # a removed enrollment alive
+        with use_primary():
+            course_ids = sorted(
+                Course.students.through.objects.filter(user_id=user_id).values_list('course_id', flat=True)
+            )
+        set_enrollments(user_id, course_ids, version)
+        return course_ids
+
+    @staticmethod
+    async def aget_course_ids(user):
+        if not user.is_authenticated:
+            return []
+        return (await EnrollmentService._aget_enrollments(user.pk))[1]
+
+    @staticmethod
+    async def _aget_enrollments(user_id):
+        entry = await aget_enrollments(user_id)
+        if entry is None:
+            entry = time.time(), await EnrollmentService.arefresh_course_ids(user_id)
+        return entry
+
+    @staticmethod
+    async def arefresh_course_ids(user_id):
+        version = await aget_enrollment_version(user_id)
+        with use_primary():
+            course_ids = sorted([
+                course_id async for course_id in
+                Course.students.through.objects.filter(user_id=user_id).values_list('course_id', flat=True)
+            ])
+        await aset_enrollments(user_id, course_ids, version)
+        return course_ids
+
+    @staticmethod
+    def _contains(course_ids, course_id):
+        index = bisect_left(course_ids, course_id)
+        return index < len(course_ids) and course_ids[index] == course_id
+
+    @staticmethod
+    def is_enrolled(user, course_id):
+        if not user.is_authenticated:
+            return False
+        try:
+            course_id = int(course_id)
+        except (TypeError, ValueError):
+            return False
+        read_at, course_ids = EnrollmentService._get_enrollments(user.pk)
+        if EnrollmentService._contains(course_ids, course_id):
+            if not _needs_check(read_at):
+                return True
+            # another process may have unenrolled the user since
+            return EnrollmentService._contains(EnrollmentService.refresh_course_ids(user.pk), course_id)
+        # the cached set may predate an enrollment made by another process
+        with use_primary():
+            enrolled = Course.students.through.objects.filter(user_id=user.pk, course_id=course_id).exists()
+        if enrolled:
+            EnrollmentService.refresh_course_ids(user.pk)
+        return enrolled
+
+    @staticmethod
+    async def ais_enrolled(user, course_id):
+        """
+        is_enrolled for async views, the user must already be loaded
+        """
+        if not user.is_authenticated:
+            return False
+        try:
+            course_id = int(course_id)
+        except (TypeError, ValueError):
+            return False
+        read_at, course_ids = await EnrollmentService._aget_enrollments(user.pk)
+        if EnrollmentService._contains(course_ids, course_id):
+            if not _needs_check(read_at):
+                return True
+            return EnrollmentService._contains(await EnrollmentService.arefresh_course_ids(user.pk), course_id)
+        with use_primary():
+            enrolled = await Course.students.through.objects.filter(user_id=user.pk, course_id=course_id).aexists()
+        if enrolled:
+            await EnrollmentService.arefresh_course_ids(user.pk)
+        return enrolled
+
+    @staticmethod
+    def can_view_item(user, item):
+        """
+        Whether the user owns a content item or is enrolled in a course
+        containing it
+        """
+        if not user.is_authenticated:
+            return False
+        if item.owner_id == user.pk:
+            return True
+        course_ids = Content.objects.filter(
+            content_type=ContentType.objects.get_for_model(item), object_id=item.pk
+        ).values_list('module__course_id', flat=True)
+        return any(EnrollmentService.is_enrolled(user, course_id) for course_id in course_ids)
+
+    @staticmethod
+    def enroll(user, course):
+        course.students.add(user)
+        transaction.on_commit(lambda: EnrollmentService.refresh_course_ids(user.pk))
+
+    @staticmethod
+    def unenroll(user, course):
+        course.students.remove(user)
+        transaction.on_commit(lambda: EnrollmentService.refresh_course_ids(user.pk))
+
+    @staticmethod
+    def enroll_many(user, course_ids):
+        """
+        Enroll a user in several courses with one bulk insert into the
+        enrollment table, returning the outcome for each requested course
+        """
+        course_ids = list(dict.fromkeys(course_ids))
+        Enrollment = Course.students.through
+        using = router.db_for_write(Enrollment, instance=user)
+        with transaction.atomic(using=using):
+            existing = set(
+                Course.objects.using(using).filter(pk__in=course_ids).values_list('pk', flat=True)
+            )
+            enrolled = set(
+                Enrollment.objects.using(using).filter(
+                    user_id=user.pk, course_id__in=existing
+                ).values_list('course_id', flat=True)
+            )
+            new = {course_id for course_id in course_ids if course_id in existing - enrolled}
+            if new:
+                # bulk_create skips the m2m signals sent by add(), send them here
+                signal_kwargs = dict(
+                    sender=Enrollment, instance=user, reverse=True,
+                    model=Course, pk_set=new, using=using
+                )
+                m2m_changed.send(action='pre_add', **signal_kwargs)
+                Enrollment.objects.using(using).bulk_create(
+                    [Enrollment(course_id=course_id, user_id=user.pk) for course_id in new],
+                    ignore_conflicts=True
+                )
+                m2m_changed.send(action='post_add', **signal_kwargs)
+                transaction.on_commit(lambda: EnrollmentService.refresh_course_ids(user.pk), using=using)
+        results = []
+        for course_id in course_ids:
+            if course_id not in existing:
+                status = 'not_found'
+            elif course_id in enrolled:
+                status = 'already_enrolled'
+            else:
+                status = 'enrolled'
+            results.append({
+                'course': course_id,
+                'enrolled': course_id in existing,
+                'status': status,
+            })
+        return results
@@ -0,0 +1,237 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import blobs
+from .api.snapshots import invalidate_course_snapshots, invalidate_item_snapshots
+from ..users.models import User
+from .cache import delete_rendered_item, delete_enrollments, delete_outlines, delete_tags
+from .counters import increment, refresh_course_counters, refresh_enrollment_counters
+from .managers import post_bulk_append, post_reorder
+from .models import Subject, Course, Module, Content, Text, Video, Image, File
+from .search import SEARCH_MODELS, index_objects, remove_object
+
+ITEM_MODELS = (Text, Video, Image, File)
+
+
+def item_saved(sender, instance, **kwargs):
+    invalidate_item_snapshots(instance)
+
+
+def item_deleted(sender, instance, **kwargs):
+    """
+    Drop the rendered fragment of a deleted item
+    """
+    delete_rendered_item(instance)
+    invalidate_item_snapshots(instance)
+
+
+for model in ITEM_MODELS:
+    post_save.connect(item_saved, sender=model, dispatch_uid=f"item_saved_{model._meta.model_name}")
+    post_delete.connect(item_deleted, sender=model, dispatch_uid=f"item_deleted_{model._meta.model_name}")
+
+
+def search_object_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_objects([instance])
+
+
+def search_object_deleted(sender, instance, **kwargs):
+    remove_object(instance)
+
+
+for model in SEARCH_MODELS:
+    post_save.connect(search_object_saved, sender=model, dispatch_uid=f"search_saved_{model._meta.model_name}")
+    post_delete.connect(search_object_deleted, sender=model, dispatch_uid=f"search_deleted_{model._meta.model_name}")
+
+
+def blob_item_saving(sender, instance, raw=False, **kwargs):
+    # remember the stored file to move the reference on change
+    instance._previous_blob = None
+    if not raw and not instance._state.adding:
+        instance._previous_blob = sender.objects.filter(
+            pk=instance.pk
+        ).values_list(blobs.BLOB_FIELDS[sender], flat=True).first()
+
+
+def blob_item_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    name = getattr(instance, blobs.BLOB_FIELDS[sender]).name
+    previous = getattr(instance, '_previous_blob', None)
+    if name != previous:
+        if name:
+            blobs.add_reference(name)
+        if previous:
+            blobs.remove_reference(previous)
+
+
+def blob_item_deleted(sender, instance, **kwargs):
+    name = getattr(instance, blobs.BLOB_FIELDS[sender]).name
+    if name:
+        blobs.remove_reference(name)
+
+
+for model in blobs.BLOB_FIELDS:
+    pre_save.connect(blob_item_saving, sender=model, dispatch_uid=f"blob_saving_{model._meta.model_name}")
+    post_save.connect(blob_item_saved, sender=model, dispatch_uid=f"blob_saved_{model._meta.model_name}")
+    post_delete.connect(blob_item_deleted, sender=model, dispatch_uid=f"blob_deleted_{model._meta.model_name}")
+
+
+def drop_outlines(course_ids, using=None):
+    """
+    Make the cached outlines of the given courses stale once the change is
+    committed, an outline read before is cached under the previous version
+    """
+    course_ids = set(course_ids)
+    transaction.on_commit(lambda: delete_outlines(course_ids), using=using)
+
+
+def drop_catalog_tags(tags, using=None):
+    """
+    Make the cached catalog pages showing one of the tags stale once the
+    change is committed, see catalog.py
+    """
+    tags = set(tags)
+    transaction.on_commit(lambda: delete_tags(tags), using=using)
+
+
+@receiver(pre_save, sender=Course)
+def course_saving(sender, instance, **kwargs):
+    # remember the stored subject to move the counter on subject change
+    instance._previous_subject_id = None
+    if not instance._state.adding:
+        instance._previous_subject_id = Course.objects.filter(
+            pk=instance.pk
+        ).values_list('subject_id', flat=True).first()
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, using=None, **kwargs):
+    if created:
+        increment(Subject, instance.subject_id, 'total_courses', 1)
+        drop_catalog_tags(['catalog', 'subjects', f'subject:{instance.subject_id}'], using)
+        return
+    previous_subject_id = getattr(instance, '_previous_subject_id', None)
+    if previous_subject_id is not None and previous_subject_id != instance.subject_id:
+        increment(Subject, previous_subject_id, 'total_courses', -1)
+        increment(Subject, instance.subject_id, 'total_courses', 1)
+        drop_catalog_tags(['subjects', f'subject:{previous_subject_id}', f'subject:{instance.subject_id}'], using)
+    drop_catalog_tags([f'course:{instance.pk}'], using)
+    invalidate_course_snapshots([instance.pk])
+    drop_outlines([instance.pk], using)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, using=None, **kwargs):
+    increment(Subject, instance.subject_id, 'total_courses', -1)
+    drop_catalog_tags(['catalog', 'subjects', f'subject:{instance.subject_id}', f'course:{instance.pk}'], using)
+    drop_outlines([instance.pk], using)
+
+
+@receiver(post_save, sender=Module)
+def module_saved(sender, instance, created, using=None, **kwargs):
+    if created:
+        increment(Course, instance.course_id, 'total_modules', 1)
+        drop_catalog_tags([f'course:{instance.course_id}'], using)
+    invalidate_course_snapshots([instance.course_id])
+    drop_outlines([instance.course_id], using)
+
+
+@receiver(post_delete, sender=Module)
+def module_deleted(sender, instance, using=None, **kwargs):
+    increment(Course, instance.course_id, 'total_modules', -1)
+    drop_catalog_tags([f'course:{instance.course_id}'], using)
+    invalidate_course_snapshots([instance.course_id])
+    drop_outlines([instance.course_id], using)
+
+
+@receiver(post_bulk_append, sender=Module)
+def modules_appended(sender, objs, using=None, **kwargs):
+    course_ids = {module.course_id for module in objs}
+    refresh_course_counters(course_ids)
+    invalidate_course_snapshots(course_ids)
+    drop_outlines(course_ids, using)
+    drop_catalog_tags([f'course:{course_id}' for course_id in course_ids], using)
+    index_objects(objs)
+
+
+@receiver(post_bulk_append, sender=Content)
+def contents_appended(sender, objs, **kwargs):
+    invalidate_course_snapshots(
+        Module.objects.filter(
+            pk__in={content.module_id for content in objs}
+        ).values_list('course_id', flat=True)
+    )
+    text_type = ContentType.objects.get_for_model(Text)
+    index_objects(Text.objects.filter(
+        pk__in=[content.object_id for content in objs if content.content_type_id == text_type.pk]
+    ))
+
+
+@receiver(post_reorder, sender=Module)
+def modules_reordered(sender, pks, using=None, **kwargs):
+    course_ids = set(Module.objects.filter(pk__in=pks).values_list('course_id', flat=True))
+    invalidate_course_snapshots(course_ids)
+    drop_outlines(course_ids, using)
+
+
+@receiver(post_reorder, sender=Content)
+def contents_reordered(sender, pks, **kwargs):
+    invalidate_course_snapshots(
+        Content.objects.filter(pk__in=pks).values_list('module__course_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def subject_changed(sender, instance, using=None, **kwargs):
+    drop_catalog_tags(['subjects', f'subject:{instance.pk}'], using)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, using=None, **kwargs):
+    # instructor names are shown in the catalog, logins only set last_login
+    if not created and set(update_fields or ()) != {'last_login'}:
+        drop_catalog_tags([f'user:{instance.pk}'], using)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def enrollment_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """
+    Recount the students of the courses touched by an enrollment change and
+    drop the cached enrollment sets of the students involved
+    """
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(), remember the related ids
+        related = instance.courses_joined if reverse else instance.students
+        instance._cleared_pks = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        # user.courses_joined.add/remove/clear
+        course_ids, user_ids = pk_set, [instance.pk]
+    else:
+        # course.students.add/remove/clear
+        course_ids, user_ids = [instance.pk], pk_set
+    refresh_enrollment_counters(course_ids)
+    transaction.on_commit(lambda: delete_enrollments(user_ids), using=using)
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def content_changed(sender, instance, **kwargs):
+    invalidate_course_snapshots(
+        Module.objects.filter(pk=instance.module_id).values_list('course_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Content)
+def content_saved(sender, instance, created, **kwargs):
+    # texts are indexed with the course of their content
+    if created and instance.content_type_id == ContentType.objects.get_for_model(Text).pk:
+        index_objects(Text.objects.filter(pk=instance.object_id))
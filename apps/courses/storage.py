@@ -0,0 +1,71 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME_RE = re.compile(r'^(?:.+/)?[0-9a-f]{2}/[0-9a-f]{64}(?:\.[0-9a-z]+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage keeping every upload once, under the SHA-256 of its
+    bytes: ``<upload_to>/<first two hex digits>/<hash><extension>``.
+    Uploads are streamed in chunks to a temporary file while being hashed,
+    then moved in place, or dropped when the same bytes are already stored.
+    References to the stored blobs are counted by the Blob model, the blob
+    of a deduplicated upload is marked live so that it is not collected
+    before the item referencing it is saved.
+    """
+    chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # the stored name is derived from the content in _save
+        return name
+
+    def hashed_name(self, name, digest):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()[:10]
+        return os.path.join(directory, digest[:2], digest + extension).replace('\\', '/')
+
+    def _save(self, name, content):
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(prefix='.upload-', dir=self.location)
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                for chunk in content.chunks(chunk_size=self.chunk_size):
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            name = self.hashed_name(name, digest.hexdigest())
+            full_path = self.path(name)
+            if os.path.exists(full_path) and self.mark_live(name) and os.path.exists(full_path):
+                # the same bytes are already stored
+                return name
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.directory_permissions_mode is not None:
+                os.chmod(os.path.dirname(full_path), self.directory_permissions_mode)
+            os.replace(temp_path, full_path)
+            temp_path = None
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+            return name
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+    def mark_live(self, name):
+        # keeps the garbage collector off the file until the item is saved
+        from .blobs import mark_live
+        return mark_live(name)
+
+    def is_hashed_name(self, name):
+        return bool(HASHED_NAME_RE.match(name))
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    return content_storage
@@ -1,3 +1,937 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from urllib import parse
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image as PILImage
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from learnXpert.db_router import ReplicaRouter, ReplicaRoutingMiddleware, use_primary
+
+from ..users.models import User
+from .api import snapshots
+from .api.authentication import get_token_user, make_token
+from . import blobs, export, models, views
+from .archive import (
+    CONTENTS, MANIFEST, ArchiveError, export_course_archive, import_course_archive, unique_slug
+)
+from .cache import delete_tags, item_render_key
+from .custom_fields import ORDER_STEP
+from .managers import prefetch_contents
+from .models import Subject, Course, CourseSnapshot, Module, Content, Text, Video, Image, File, Blob
+from .search import MAX_SEARCH_PAGE
+from .services import EnrollmentService
+from .storage import content_storage
+
+
+class CourseFixtureMixin:
+    """
+    An instructor, a student and a course of one subject with two modules
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner@example.com', 'secret', is_active=True)
+        cls.student = User.objects.create_user('student@example.com', 'secret', is_active=True)
+        cls.subject = Subject.objects.create(title='Mathematics', slug='mathematics')
+        cls.course = Course.objects.create(
+            owner=cls.owner, subject=cls.subject, title='Algebra', slug='algebra', overview='Groups'
+        )
+        cls.modules = [
+            Module.objects.create(course=cls.course, title=f'Module {index}', description='')
+            for index in range(2)
+        ]
+
+    def add_text(self, module, title='Text'):
+        item = Text.objects.create(owner=self.owner, title=title, content='Content')
+        return Content.objects.create(module=module, item=item)
+
+
+class CounterTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.other_subject = Subject.objects.create(title='Physics', slug='physics')
+
+    def counts(self):
+        subjects = dict(Subject.objects.values_list('slug', 'total_courses'))
+        course = Course.objects.values('total_modules', 'total_students').get(pk=self.course.pk)
+        return subjects['mathematics'], subjects['physics'], course['total_modules'], course['total_students']
+
+    def test_courses_and_modules(self):
+        self.assertEqual(self.counts(), (1, 0, 2, 0))
+        course = Course.objects.create(
+            owner=self.owner, subject=self.other_subject, title='Mechanics', slug='mechanics', overview=''
+        )
+        module = Module.objects.create(course=self.course, title='Third', description='')
+        self.assertEqual(self.counts(), (1, 1, 3, 0))
+        Module.objects.bulk_append(
+            Module(course=self.course, title=f'Bulk {index}', description='') for index in range(2)
+        )
+        self.assertEqual(self.counts(), (1, 1, 5, 0))
+        module.delete()
+        course.delete()
+        self.assertEqual(self.counts(), (1, 0, 4, 0))
+
+    def test_subject_moves(self):
+        stale = Course.objects.get(pk=self.course.pk)
+        self.course.subject = self.other_subject
+        self.course.save()
+        self.assertEqual(self.counts(), (0, 1, 2, 0))
+        Module.objects.create(course=self.course, title='Third', description='')
+        # saving a stale instance keeps the counters
+        stale.title = 'Stale'
+        stale.subject = self.other_subject
+        stale.save()
+        self.assertEqual(self.counts(), (0, 1, 3, 0))
+
+    def test_enrollments(self):
+        other = User.objects.create_user('other@example.com', 'secret', is_active=True)
+        self.course.students.add(self.student, other)
+        self.assertEqual(self.counts()[3], 2)
+        self.course.students.remove(other)
+        self.assertEqual(self.counts()[3], 1)
+        self.course.students.clear()
+        self.assertEqual(self.counts()[3], 0)
+        other.courses_joined.add(self.course)
+        self.student.courses_joined.add(self.course)
+        self.assertEqual(self.counts()[3], 2)
+        # pk_set is not sent with clear(), the cleared courses are recounted
+        self.student.courses_joined.clear()
+        self.assertEqual(self.counts()[3], 1)
+
+    def test_rebuild_counters(self):
+        self.course.students.add(self.student)
+        Subject.objects.update(total_courses=7)
+        Course.objects.update(total_modules=0, total_students=3)
+        output = io.StringIO()
+        call_command('rebuild_counters', stdout=output)
+        self.assertEqual(self.counts(), (1, 0, 2, 1))
+        self.assertIn('Rebuilt counters of 2 subjects and 1 courses', output.getvalue())
+
+
+class OrderFieldTests(CourseFixtureMixin, TestCase):
+    def test_insert_allocates_orders_per_scope(self):
+        self.assertEqual([module.order for module in self.modules], [ORDER_STEP, 2 * ORDER_STEP])
+        first = [self.add_text(self.modules[0]) for _ in range(3)]
+        other = self.add_text(self.modules[1])
+        self.assertEqual([content.order for content in first], [ORDER_STEP, 2 * ORDER_STEP, 3 * ORDER_STEP])
+        self.assertEqual(other.order, ORDER_STEP)
+
+    def test_insert_follows_the_last_order_of_the_scope(self):
+        Module.objects.filter(pk=self.modules[1].pk).update(order=10 * ORDER_STEP)
+        module = Module.objects.create(course=self.course, title='Last', description='')
+        self.assertEqual(module.order, 11 * ORDER_STEP)
+
+    def test_explicit_order_is_kept(self):
+        module = Module.objects.create(course=self.course, title='First', description='', order=1)
+        self.assertEqual(Module.objects.get(pk=module.pk).order, 1)
+
+    def test_bulk_append(self):
+        modules = Module.objects.bulk_append(
+            Module(course=self.course, title=f'Bulk {index}', description='') for index in range(3)
+        )
+        self.assertEqual([module.order for module in modules], [3 * ORDER_STEP, 4 * ORDER_STEP, 5 * ORDER_STEP])
+
+
+class ReorderTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.contents = [self.add_text(self.modules[0], f'Text {index}') for index in range(4)]
+
+    def sequence(self, module):
+        return list(module.contents.values_list('pk', flat=True))
+
+    def test_full_reorder(self):
+        a, b, c, d = (content.pk for content in self.contents)
+        updated = Content.objects.reorder({d: 0, a: 1, b: 2, c: 3})
+        self.assertEqual(self.sequence(self.modules[0]), [d, a, b, c])
+        # the sorted run a, b, c keeps its orders
+        self.assertEqual(updated, 1)
+
+    def test_partial_reorder_keeps_the_other_rows_of_the_scope(self):
+        a, b, c, d = (content.pk for content in self.contents)
+        Content.objects.reorder({a: 2})
+        self.assertEqual(self.sequence(self.modules[0]), [b, c, a, d])
+        orders = list(self.modules[0].contents.values_list('order', flat=True))
+        self.assertEqual(len(set(orders)), 4)
+
+    def test_rows_of_several_scopes_are_rejected(self):
+        other = self.add_text(self.modules[1])
+        with self.assertRaises(ValueError):
+            Content.objects.reorder({self.contents[0].pk: 0, other.pk: 1})
+
+    def test_rows_outside_of_the_queryset(self):
+        with self.assertRaises(Content.DoesNotExist):
+            Content.objects.filter(module__course__owner=self.student).reorder({self.contents[0].pk: 1})
+
+    def test_order_view(self):
+        a, b, c, d = (content.pk for content in self.contents)
+        other = self.add_text(self.modules[1])
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse('courses:content_order'), {a: 0, other.pk: 1}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse('courses:module_order'), {self.modules[1].pk: 0}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(self.course.modules.values_list('pk', flat=True)), [module.pk for module in self.modules[::-1]]
+        )
+        self.client.force_login(self.student)
+        response = self.client.post(reverse('courses:content_order'), {a: 3}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ContentPrefetchTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        module = self.modules[0]
+        self.add_text(module)
+        deleted = self.add_text(module, 'Deleted').item
+        Content.objects.create(module=module, item=Video.objects.create(
+            owner=self.owner, title='Video', url='https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+        ))
+        # stored names, without processing the files
+        Content.objects.create(module=module, item=Image.objects.bulk_create([
+            Image(owner=self.owner, title='Image', image='images/image.jpg', width=16, height=9, format='JPEG')
+        ])[0])
+        Content.objects.create(module=module, item=File.objects.bulk_create([
+            File(owner=self.owner, title='File', file='files/file.pdf')
+        ])[0])
+        deleted.delete()
+
+    def titles(self, contents):
+        return [content.item.title if content.item else None for content in contents]
+
+    def test_one_query_per_item_model(self):
+        # the contents, then the texts, videos, images and files
+        with self.assertNumQueries(5):
+            titles = self.titles(Content.objects.filter(module=self.modules[0]).with_items())
+        self.assertEqual(titles, ['Text', None, 'Video', 'Image', 'File'])
+
+    def test_prefetch_contents(self):
+        with self.assertNumQueries(6):
+            modules = list(Module.objects.filter(course=self.course).prefetch_related(prefetch_contents()))
+            titles = [self.titles(module.contents.all()) for module in modules]
+        self.assertEqual(titles, [['Text', None, 'Video', 'Image', 'File'], []])
+        with self.assertNumQueries(7):
+            course = Course.objects.prefetch_related(prefetch_contents('modules__contents')).get(pk=self.course.pk)
+            titles = [self.titles(module.contents.all()) for module in course.modules.all()]
+        self.assertEqual(titles, [['Text', None, 'Video', 'Image', 'File'], []])
+
+
+class RenderCacheTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.text = self.add_text(self.modules[0]).item
+
+    def test_rendered_item_is_cached(self):
+        self.assertIn('Content', self.text.render())
+        self.assertIn('Content', cache.get(item_render_key(self.text)))
+        with mock.patch.object(models, 'render_to_string') as render:
+            self.assertIn('Content', Text.objects.get(pk=self.text.pk).render())
+        render.assert_not_called()
+
+    def test_edits_change_the_key(self):
+        self.text.render()
+        key = item_render_key(self.text)
+        self.text.modified_at += timedelta(seconds=1)
+        self.assertNotEqual(item_render_key(self.text), key)
+        self.text.content = 'Edited'
+        self.text.save()
+        self.assertNotEqual(item_render_key(self.text), key)
+        self.assertIn('Edited', Text.objects.get(pk=self.text.pk).render())
+
+    def test_deletion_drops_the_fragment(self):
+        self.text.render()
+        key = item_render_key(self.text)
+        self.text.delete()
+        self.assertIsNone(cache.get(key))
+
+
+class SnapshotTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course.students.add(self.student)
+        self.text = self.add_text(self.modules[0]).item
+        self.url = reverse('api:course-contents', args=[self.course.pk])
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {make_token(self.student)}'}
+
+    def get(self, **headers):
+        return self.client.get(self.url, **self.headers, **headers)
+
+    def test_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['modules'][0]['contents'][0]['item'], '<p>Content</p>')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(CourseSnapshot.objects.count(), 1)
+
+    def test_changes_rebuild_the_snapshot(self):
+        etags = [self.get()['ETag']]
+        self.text.content = 'Edited'
+        self.text.save()
+        etags.append(self.get()['ETag'])
+        self.add_text(self.modules[1], 'Added')
+        etags.append(self.get()['ETag'])
+        self.modules[1].title = 'Renamed'
+        self.modules[1].save()
+        etags.append(self.get()['ETag'])
+        self.modules[1].delete()
+        response = self.get()
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), 5)
+        modules = response.json()['modules']
+        self.assertEqual([module['title'] for module in modules], ['Module 0'])
+        self.assertEqual(modules[0]['contents'][0]['item'], '<p>Edited</p>')
+
+    def test_change_committed_while_building(self):
+        render = snapshots.JSONRenderer.render
+
+        def racing(renderer, data, *args, **kwargs):
+            # the rename commits once the course was read
+            self.modules[0].title = 'Renamed'
+            self.modules[0].save()
+            return render(renderer, data, *args, **kwargs)
+        with mock.patch.object(snapshots.JSONRenderer, 'render', racing):
+            self.assertEqual(self.get().json()['modules'][0]['title'], 'Module 0')
+        self.assertEqual(self.get().json()['modules'][0]['title'], 'Renamed')
+
+
+class SearchTests(CourseFixtureMixin, TestCase):
+    def test_search_pages_are_capped(self):
+        response = self.client.get(reverse('courses:course_search'), {'q': 'algebra'})
+        self.assertContains(response, 'Algebra')
+        response = self.client.get(reverse('courses:course_search'), {'q': 'algebra', 'page': MAX_SEARCH_PAGE + 1})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('api:search'), {'q': 'algebra', 'page': MAX_SEARCH_PAGE + 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_texts_are_only_found_by_owners_and_students(self):
+        self.add_text(self.modules[0], 'Lagrange theorem')
+
+        def found():
+            html = self.client.get(reverse('courses:course_search'), {'q': 'lagrange'}).content.decode()
+            api = self.client.get(reverse('api:search'), {'q': 'lagrange'}).json()['results']
+            return 'Lagrange theorem' in html, [result['title'] for result in api]
+        self.assertEqual(found(), (False, []))
+        self.client.force_login(self.student)
+        self.assertEqual(found(), (False, []))
+        self.course.students.add(self.student)
+        cache.clear()
+        self.assertEqual(found(), (True, ['Lagrange theorem']))
+        self.client.force_login(self.owner)
+        self.assertEqual(found(), (True, ['Lagrange theorem']))
+
+    def test_slugs_of_the_course_urls_are_reserved(self):
+        course = Course(owner=self.owner, subject=self.subject, title='Search', slug='search', overview='')
+        with self.assertRaises(ValidationError):
+            course.full_clean()
+        self.assertEqual(unique_slug('search'), 'search-2')
+
+
+def png_upload(width=400, height=300):
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (width, height), 'teal').save(buffer, 'PNG')
+    return SimpleUploadedFile('picture.png', buffer.getvalue(), content_type='image/png')
+
+
+class ImageDerivativeTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.image = Image.objects.create(owner=self.owner, title='Picture', image=png_upload())
+        Content.objects.create(module=self.modules[0], item=self.image)
+        self.url = reverse('courses:image_derivative', args=[self.image.pk, 320, 'png'])
+
+    def test_anonymous_and_unenrolled_users_get_404(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_rendered_image_only_links_to_access_controlled_views(self):
+        html = self.image.render()
+        self.assertNotIn(settings.MEDIA_URL, html)
+        self.assertIn(f'src="{reverse("courses:image_file", args=[self.image.pk])}"', html)
+        url = reverse('courses:image_file', args=[self.image.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.course.students.add(self.student)
+        self.client.force_login(self.student)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        response.close()
+
+    def test_enrolled_students_and_the_owner_get_the_derivative(self):
+        self.course.students.add(self.student)
+        for user in (self.student, self.owner):
+            self.client.force_login(user)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+            response.close()
+
+
+class BlobTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def upload(self, data=b'0123456789', title='Notes'):
+        return File.objects.create(owner=self.owner, title=title, file=SimpleUploadedFile('notes.txt', data))
+
+    def blob(self, name):
+        return Blob.objects.filter(pk=name).values_list('refcount', 'unreferenced_since').first()
+
+    def make_old(self, name, days=2):
+        old = timezone.now() - timedelta(days=days)
+        Blob.objects.filter(pk=name, refcount=0).update(unreferenced_since=old)
+        path = content_storage.path(name)
+        os.utime(path, (old.timestamp(), old.timestamp()))
+
+    def test_identical_uploads_share_a_counted_blob(self):
+        first, second = self.upload(), self.upload(title='Copy')
+        name = first.file.name
+        self.assertEqual(second.file.name, name)
+        self.assertTrue(content_storage.is_hashed_name(name))
+        self.assertEqual(self.blob(name), (2, None))
+        second.file = SimpleUploadedFile('other.txt', b'other')
+        second.save()
+        self.assertEqual(self.blob(name), (1, None))
+        self.assertEqual(self.blob(second.file.name), (1, None))
+        first.delete()
+        refcount, unreferenced_since = self.blob(name)
+        self.assertEqual(refcount, 0)
+        self.assertIsNotNone(unreferenced_since)
+
+    def test_rebuild_references(self):
+        item = self.upload()
+        name = item.file.name
+        Blob.objects.filter(pk=name).update(refcount=5)
+        Blob.objects.create(name='files/00/lost.txt', refcount=1)
+        self.assertEqual(blobs.rebuild_references(), 2)
+        self.assertEqual(self.blob(name), (1, None))
+        refcount, unreferenced_since = self.blob('files/00/lost.txt')
+        self.assertEqual(refcount, 0)
+        self.assertIsNotNone(unreferenced_since)
+
+    def test_collect_garbage(self):
+        kept, collected = self.upload(), self.upload(b'collected')
+        name = collected.file.name
+        collected.delete()
+        self.assertEqual(blobs.collect_garbage(), (0, 0))
+        self.make_old(name)
+        orphan = content_storage.save('files/orphan.txt', io.BytesIO(b'orphan'))
+        self.make_old(orphan)
+        self.assertEqual(blobs.collect_garbage(dry_run=True), (2, 15))
+        self.assertTrue(content_storage.exists(name))
+        self.assertEqual(blobs.collect_garbage(), (2, 15))
+        self.assertFalse(content_storage.exists(name))
+        self.assertFalse(content_storage.exists(orphan))
+        self.assertFalse(Blob.objects.filter(pk__in=[name, orphan]).exists())
+        self.assertTrue(content_storage.exists(kept.file.name))
+        self.assertEqual(self.blob(kept.file.name), (1, None))
+
+    def test_uploads_deduplicated_to_collectable_blobs_keep_them(self):
+        collected = self.upload()
+        name = collected.file.name
+        collected.delete()
+        self.make_old(name)
+        orphan = content_storage.save('files/orphan.txt', io.BytesIO(b'orphan'))
+        Blob.objects.filter(pk=orphan).delete()
+        self.make_old(orphan)
+        add_reference = blobs.add_reference
+
+        def racing(stored_name):
+            # the collection runs before the reference is counted
+            blobs.collect_garbage()
+            add_reference(stored_name)
+        with mock.patch.object(blobs, 'add_reference', racing):
+            items = [self.upload(), self.upload(b'orphan')]
+        for item, stored, data in zip(items, (name, orphan), (b'0123456789', b'orphan')):
+            self.assertEqual(item.file.name, stored)
+            self.assertEqual(self.blob(stored), (1, None))
+            with item.file.open('rb') as stored_file:
+                self.assertEqual(stored_file.read(), data)
+
+    def test_blobs_collected_during_the_upload_are_stored_again(self):
+        collected = self.upload()
+        name = collected.file.name
+        collected.delete()
+        self.make_old(name)
+        mark_live = blobs.mark_live
+
+        def racing(stored_name):
+            # the collection deletes the blob once the upload found its file
+            blobs.collect_garbage()
+            return mark_live(stored_name)
+        with mock.patch.object(blobs, 'mark_live', racing):
+            item = self.upload()
+        self.assertEqual(item.file.name, name)
+        self.assertEqual(self.blob(name), (1, None))
+        with item.file.open('rb') as stored_file:
+            self.assertEqual(stored_file.read(), b'0123456789')
+
+
+class ArchiveImportTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.add_text(self.modules[0])
+        archive = io.BytesIO()
+        export_course_archive(self.course, archive)
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as source:
+            self.manifest = json.loads(source.read(MANIFEST))
+            self.contents = source.read(CONTENTS)
+
+    def archive(self, contents=None):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as target:
+            target.writestr(MANIFEST, json.dumps(self.manifest))
+            target.writestr(CONTENTS, self.contents if contents is None else contents)
+        archive.seek(0)
+        return archive
+
+    def test_import(self):
+        course = import_course_archive(self.archive(), self.owner)
+        self.assertEqual((course.subject, course.slug), (self.subject, 'algebra-2'))
+        self.assertEqual(Content.objects.filter(module__course=course).count(), 1)
+
+    def test_invalid_manifest_values(self):
+        course = self.manifest['course']
+        for field, value in (('title', None), ('title', 'x' * 201), ('slug', 'not a slug'), ('overview', [])):
+            with self.subTest(field=field, value=value):
+                self.manifest['course'] = {**course, field: value}
+                with self.assertRaises(ArchiveError):
+                    import_course_archive(self.archive(), self.owner)
+        self.assertEqual(Course.objects.count(), 1)
+
+    def test_invalid_content_record(self):
+        record = {'type': 'text', 'module': 0, 'title': None, 'content': 'Content'}
+        with self.assertRaises(ArchiveError):
+            import_course_archive(self.archive(json.dumps(record)), self.owner)
+
+    def test_archives_over_the_limits_are_rejected(self):
+        limits = {'ARCHIVE_MAX_ENTRIES': 1}, {'ARCHIVE_MAX_SIZE': 100}, {'ARCHIVE_MAX_RECORD_SIZE': 50}
+        for limit in limits:
+            with self.subTest(**limit), override_settings(**limit), \
+                    mock.patch('apps.courses.archive._store_media') as store_media:
+                with self.assertRaises(ArchiveError):
+                    import_course_archive(self.archive(), self.owner)
+                store_media.assert_not_called()
+        with override_settings(ARCHIVE_MAX_RECORD_SIZE=len(json.dumps(self.manifest)) + 1):
+            record = {'type': 'text', 'module': 0, 'title': 'Long', 'content': 'x' * 10000}
+            with self.assertRaisesMessage(ArchiveError, 'Line 1 of contents.ndjson is longer'):
+                import_course_archive(self.archive(json.dumps(record)), self.owner)
+        self.assertEqual(Course.objects.count(), 1)
+
+    def test_new_subjects_need_add_subject(self):
+        self.manifest['subject'] = {'title': 'Physics', 'slug': 'physics'}
+        with self.assertRaises(ArchiveError):
+            import_course_archive(self.archive(), self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.user_permissions.add(Permission.objects.get(codename='add_subject'))
+        owner = User.objects.get(pk=self.owner.pk)
+        course = import_course_archive(self.archive(), owner)
+        self.assertEqual(course.subject.slug, 'physics')
+
+    def test_import_action_answers_400(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.user_permissions.add(Permission.objects.get(codename='add_course'))
+        self.client.force_login(self.owner)
+        self.manifest['course']['title'] = None
+        response = self.client.post(reverse('api:course-import-archive'), {'archive': self.archive()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('title', response.json()['archive'])
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(CourseFixtureMixin, TestCase):
+    """
+    Routing decisions taken within ReplicaRoutingMiddleware, the test
+    database having no replica to read from
+    """
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+
+    def call(self, view, method='get', cookies=None, replica_reads=True):
+        view.replica_reads = replica_reads
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(request)
+
+    def test_reads_of_safe_requests_go_to_the_replicas(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Course))
+            seen.append(self.router.db_for_read(User))
+            with use_primary():
+                seen.append(self.router.db_for_read(Course))
+            return HttpResponse()
+        response = self.call(view)
+        self.assertEqual(seen, ['replica1', 'default', 'default'])
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+
+    def test_other_views_and_methods_read_from_the_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Course))
+            return HttpResponse()
+        self.call(view, replica_reads=False)
+        self.call(view, method='post')
+        self.assertEqual(seen, ['default', 'default'])
+
+    def test_writes_keep_the_reads_of_the_user_on_the_primary(self):
+        seen = []
+
+        def write(request):
+            seen.append(self.router.db_for_write(Course))
+            return HttpResponse()
+
+        def read(request):
+            seen.append(self.router.db_for_read(Course))
+            return HttpResponse()
+        response = self.call(write, method='post')
+        cookie = response.cookies[settings.REPLICA_STICKY_COOKIE]
+        self.assertEqual(int(cookie['max-age']), settings.REPLICA_STICKY_SECONDS)
+        self.call(read, cookies={cookie.key: cookie.value})
+        self.call(read, cookies={cookie.key: str(int(time.time()) - 1)})
+        self.assertEqual(seen, ['default', 'default', 'replica1'])
+
+    def test_enrollments_are_read_from_the_primary(self):
+        Course.students.through.objects.create(course=self.course, user=self.student)
+        enrolled = []
+
+        def view(request):
+            # a query routed to the replica would fail, there is no replica1
+            enrolled.append(EnrollmentService.is_enrolled(self.student, self.course.pk))
+            enrolled.append(EnrollmentService.get_course_ids(self.student))
+            return HttpResponse()
+        self.call(view)
+        self.assertEqual(enrolled, [True, [self.course.pk]])
+
+
+class APIAuthenticationTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enroll_url = reverse('api:course-enroll', args=[self.course.pk])
+
+    def basic(self, password='secret'):
+        credentials = base64.b64encode(f'{self.student.email}:{password}'.encode()).decode()
+        return {'HTTP_AUTHORIZATION': f'Basic {credentials}'}
+
+    def bearer(self, token):
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_token(self):
+        response = self.client.post(reverse('api:token'), **self.basic())
+        self.assertEqual(response.status_code, 200)
+        token = response.json()['token']
+        self.assertEqual(self.client.post(self.enroll_url, **self.bearer(token)).status_code, 200)
+        self.assertEqual(self.client.post(self.enroll_url, **self.bearer(token + 'x')).status_code, 401)
+
+    def test_tokens_expire(self):
+        token = make_token(self.student)
+        later = time.time() + settings.API_TOKEN_MAX_AGE + 1
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertIsNone(get_token_user(token))
+            self.assertEqual(self.client.post(self.enroll_url, **self.bearer(token)).status_code, 401)
+
+    def test_password_changes_revoke_tokens_and_cached_credentials(self):
+        token = make_token(self.student)
+        self.assertEqual(self.client.post(self.enroll_url, **self.basic()).status_code, 200)
+        self.student.set_password('changed')
+        self.student.save()
+        self.assertIsNone(get_token_user(token))
+        self.assertEqual(self.client.post(self.enroll_url, **self.bearer(token)).status_code, 401)
+        # the credentials cached for the old password are not used
+        self.assertEqual(self.client.post(self.enroll_url, **self.basic()).status_code, 401)
+        self.assertEqual(self.client.post(self.enroll_url, **self.basic('changed')).status_code, 200)
+
+    def test_deactivated_users(self):
+        token = make_token(self.student)
+        User.objects.filter(pk=self.student.pk).update(is_active=False)
+        self.assertEqual(self.client.post(self.enroll_url, **self.bearer(token)).status_code, 401)
+
+
+class BatchEnrollTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.other = Course.objects.create(
+            owner=self.owner, subject=self.subject, title='Geometry', slug='geometry', overview=''
+        )
+        self.url = reverse('api:course-batch-enroll')
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {make_token(self.student)}'}
+
+    def batch_enroll(self, courses):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {'courses': courses}, content_type='application/json', **self.headers)
+
+    def test_outcome_of_each_course(self):
+        self.course.students.add(self.student)
+        response = self.batch_enroll([self.course.pk, self.other.pk, 999999, self.other.pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'course': self.course.pk, 'enrolled': True, 'status': 'already_enrolled'},
+            {'course': self.other.pk, 'enrolled': True, 'status': 'enrolled'},
+            {'course': 999999, 'enrolled': False, 'status': 'not_found'},
+        ])
+        self.assertEqual(
+            sorted(self.student.courses_joined.values_list('pk', flat=True)), [self.course.pk, self.other.pk]
+        )
+
+    def test_batch_size_is_capped(self):
+        self.assertEqual(self.batch_enroll([self.course.pk] * 501).status_code, 400)
+        self.assertEqual(self.batch_enroll([]).status_code, 400)
+        self.assertEqual(self.batch_enroll([self.course.pk] * 500).status_code, 200)
+
+    def test_counters_and_enrollment_cache(self):
+        # cached before the bulk insert, which sends m2m_changed itself
+        self.assertEqual(EnrollmentService.get_course_ids(self.student), [])
+        self.batch_enroll([self.course.pk, self.other.pk])
+        counts = Course.objects.filter(pk__in=[self.course.pk, self.other.pk]).values_list('total_students', flat=True)
+        self.assertEqual(list(counts), [1, 1])
+        self.assertEqual(EnrollmentService.get_course_ids(self.student), sorted([self.course.pk, self.other.pk]))
+        # nothing is counted twice when the batch is sent again
+        self.batch_enroll([self.course.pk, self.other.pk])
+        self.assertEqual(Course.objects.get(pk=self.course.pk).total_students, 1)
+
+
+class ExportTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.other = Course.objects.create(
+            owner=self.owner, subject=self.subject, title='Geometry', slug='geometry', overview=''
+        )
+        self.add_text(self.modules[0])
+        self.url = reverse('api:course-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_and_json(self):
+        lines = self.export().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['slug'] for record in records], ['algebra', 'geometry'])
+        self.assertEqual(records[0]['modules'], [module.pk for module in self.modules])
+        self.assertEqual(json.loads(self.export(mode='json')), records)
+        # read in chunks, in the order of the ids
+        chunks = ''.join(export.stream_courses(chunk_size=1)).splitlines()
+        self.assertEqual([json.loads(line) for line in chunks], records)
+        Course.objects.all().delete()
+        self.assertEqual(json.loads(''.join(export.stream_courses('json'))), [])
+
+    def test_expansions(self):
+        record = json.loads(self.export(expand='modules').splitlines()[0])
+        self.assertEqual(
+            [(module['order'], module['title']) for module in record['modules']],
+            [(module.order, module.title) for module in self.modules]
+        )
+        self.assertNotIn('contents', record['modules'][0])
+        self.client.force_login(self.owner)
+        User.objects.filter(pk=self.owner.pk).update(is_staff=True)
+        record = json.loads(self.export(mode='json', expand='contents'))[0]
+        contents = [module['contents'] for module in record['modules']]
+        self.assertEqual(len(contents[0]), 1)
+        self.assertIn('Content', contents[0][0]['item'])
+        self.assertEqual(contents[1], [])
+
+    def test_contents_are_exported_to_staff_only(self):
+        self.assertEqual(self.client.get(self.url, {'expand': 'contents'}).status_code, 403)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url, {'expand': 'contents'}).status_code, 403)
+        self.assertEqual(self.client.get(self.url, {'expand': 'students'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'mode': 'csv'}).status_code, 400)
+
+
+class CatalogCacheTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.other_subject = Subject.objects.create(title='Physics', slug='physics')
+        self.other = Course.objects.create(
+            owner=self.owner, subject=self.other_subject, title='Mechanics', slug='mechanics', overview=''
+        )
+        self.urls = [
+            reverse('courses:course_list'),
+            reverse('courses:course_list_subject', args=['mathematics']),
+            reverse('courses:course_list_subject', args=['physics']),
+        ]
+
+    def cached(self):
+        """
+        Whether each page is served from the cache, filling the others
+        """
+        cached = []
+        for url in self.urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            cached.append(not queries.captured_queries)
+        return cached
+
+    def test_pages_are_cached_with_validators(self):
+        self.assertEqual(self.cached(), [False, False, False])
+        self.assertEqual(self.cached(), [True, True, True])
+        response = self.client.get(self.urls[0])
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_make_the_pages_showing_them_stale(self):
+        self.cached()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.title = 'Dynamics'
+            self.other.save()
+        self.assertEqual(self.cached(), [False, True, False])
+        self.assertContains(self.client.get(self.urls[0]), 'Dynamics')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.first_name = 'Ada'
+            self.owner.save()
+        self.assertEqual(self.cached(), [False, False, False])
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(
+                owner=self.owner, subject=self.subject, title='Geometry', slug='geometry', overview=''
+            )
+        # the subject list of every page shows the course counts
+        self.assertEqual(self.cached(), [False, False, False])
+
+    def test_change_committed_while_rendering(self):
+        get_tag_versions = views.get_tag_versions
+
+        def racing(tags):
+            tags = list(tags)
+            if f'course:{self.other.pk}' in tags:
+                # the rename commits once the rows were read
+                Course.objects.filter(pk=self.other.pk).update(title='Dynamics')
+                delete_tags([f'course:{self.other.pk}'])
+            return get_tag_versions(tags)
+        with mock.patch.object(views, 'get_tag_versions', racing):
+            self.client.get(self.urls[0])
+        self.assertContains(self.client.get(self.urls[0]), 'Dynamics')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_timings_are_only_reported_to_staff(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.urls[0]))
+        self.owner.is_staff = True
+        self.owner.save()
+        self.client.force_login(self.owner)
+        self.assertIn('db;dur=', self.client.get(self.urls[0])['Server-Timing'])
+        with self.settings(SERVER_TIMING=True):
+            self.client.logout()
+            self.assertIn('Server-Timing', self.client.get(self.urls[0]))
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_cached_pages_are_rendered_from_the_primary(self):
+        # a read routed to the replica would fail, there is no replica1
+        self.assertEqual(self.cached(), [False, False, False])
+
+
+class ConditionalGetTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('courses:course_detail', args=['algebra'])
+
+    def rename_owner(self):
+        # a minute later, Last-Modified has a resolution of one second
+        User.objects.filter(pk=self.owner.pk).update(
+            first_name='Ada', updated_at=timezone.now() + timedelta(minutes=1)
+        )
+
+    def test_anonymous_detail(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.CATALOG_CACHE_MAX_AGE}')
+        self.assertEqual(response['Vary'], 'Cookie, Authorization')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.rename_owner()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Ada')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_logged_in_detail(self):
+        self.client.force_login(self.student)
+        # the first response sets the CSRF cookie of the enroll form
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.rename_owner()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_logged_in_list(self):
+        self.client.force_login(self.student)
+        url = reverse('courses:course_list')
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.rename_owner()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, 'Ada')
+
+
+class KeysetPaginationTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(6):
+            Course.objects.create(
+                owner=self.owner, subject=self.subject, title=f'Course {index}', slug=f'course-{index}', overview=''
+            )
+        # ties on created are ordered by id
+        Course.objects.filter(slug__startswith='course-').update(created=self.course.created)
+        self.expected = list(Course.objects.order_by('-created', 'id').values_list('pk', flat=True))
+
+    def walk(self, url):
+        ids, pages, previous = [], 0, None
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).json()
+            pages += 1
+            self.assertLessEqual(len(queries), 2)
+            ids.extend(course['id'] for course in data['results'])
+            previous, url = data['previous'], data['next']
+        return ids, pages, previous
+
+    def test_api_and_async_lists_share_the_keyset(self):
+        for url in (reverse('api:course-list') + '?page_size=3', reverse('api:async_course_list')):
+            with self.subTest(url=url):
+                self.assertEqual(self.walk(url)[0], self.expected)
+        ids, pages, previous = self.walk(reverse('api:course-list') + '?page_size=3')
+        self.assertEqual(pages, 3)
+        data = self.client.get(previous).json()
+        self.assertEqual([course['id'] for course in data['results']], self.expected[3:6])
+        # the cursors of the API page the HTML catalog
+        cursor = dict(parse.parse_qsl(parse.urlsplit(previous).query))['cursor']
+        response = self.client.get(reverse('courses:course_list'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('api:course-list'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
@@ -4,7 +4,8 @@ from .views import (
     UpdateCourseView, DeleteCourseView,
     CourseModuleUpdateView, ContentCreateUpdateView,
     ContentDeleteView, ModuleContentListView,
-    ModuleOrderView, ContentOrderView, CourseListView, CourseDetailView
+    ModuleOrderView, ContentOrderView, CourseListView, CourseDetailView,
+    CourseSearchView, ImageDerivativeView, ImageFileView
 )
 
 app_name = "courses"
@@ -70,6 +71,21 @@ urlpatterns = [
         ContentOrderView.as_view(),
         name='content_order'
     ),
+    path(
+        'search/',
+        CourseSearchView.as_view(),
+        name='course_search'
+    ),
+    path(
+        'image/<int:pk>/',
+        ImageFileView.as_view(),
+        name='image_file'
+    ),
+    path(
+        'image/<int:pk>/<int:width>w.<str:extension>',
+        ImageDerivativeView.as_view(),
+        name='image_derivative'
+    ),
     path(
         'subject/<slug:subject>/',
         CourseListView.as_view(),
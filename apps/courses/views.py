@@ -1,38 +1,122 @@
+import os
+
 from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.forms.models import modelform_factory
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.utils.text import slugify
 from django.views.generic.list import ListView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.base import TemplateResponseMixin, View
+from .cache import get_tag_versions
+from .catalog import build_page, get_page, set_page, listing_tags, course_tags
+from .conditional import catalog_condition, course_list_validators, course_detail_validators
 from .custom_mixins import OwnerCourseMixin, OwnerEditMixin
-from .models import Course, Module, Content, Subject
+from .downloads import serve_file
+from .models import Course, Module, Content, Subject, Image
+from .images import CONTENT_TYPES, IMAGE_WIDTHS, derivative_widths, get_derivative
+from .managers import prefetch_contents
 from .forms import ModuleFormSet
-from django.db.models import Count
+from .pagination import CreatedKeysetPaginator, InvalidCursor
+from .search import MAX_SEARCH_PAGE, search_page, text_course_ids
+from .services import EnrollmentService
+from .storage import content_storage
 from braces.views import CsrfExemptMixin, JsonRequestResponseMixin
+from learnXpert.db_router import use_primary
 
 from ..students.forms import CourseEnrollForm
 
 
+@method_decorator(catalog_condition(course_list_validators), name='get')
 class CourseListView(TemplateResponseMixin, View):
     nodel = Course
     template_name = 'courses/course/list.html'
+    paginate_by = 20
+    replica_reads = True
 
     def get(self, request, subject=None):
-        subjects = Subject.objects.annotate(total_courses=Count('courses'))
-        courses = Course.objects.annotate(total_modules=Count('modules'))
-        if subject:
-            subject = get_object_or_404(Subject, slug=subject)
+        if request.user.is_authenticated:
+            return self.render_to_response(self.get_page_context(subject))
+        page = get_page(request, subject)
+        if page is None:
+            # shared by every anonymous visitor, rendered from the primary
+            with use_primary():
+                page = self.cache_page(request, subject)
+        return self.page_response(page)
+
+    def get_page_context(self, subject_slug):
+        # total_courses and total_modules are stored counters
+        subjects = Subject.objects.all()
+        courses = Course.objects.select_related('subject', 'owner')
+        subject = None
+        if subject_slug:
+            subject = get_object_or_404(Subject, slug=subject_slug)
             courses = courses.filter(subject=subject)
-        context = {
-            'subjects': subjects, 'subject': subject, 'courses': courses
+        try:
+            page = CreatedKeysetPaginator(courses, self.paginate_by).page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid cursor")
+        return {
+            'subjects': subjects, 'subject': subject, 'courses': page, 'page': page
         }
-        return self.render_to_response(context)
+
+    def cache_page(self, request, subject_slug):
+        """
+        Render the page for anonymous visitors and cache it under the versions
+        of its tags, taken before the rows it shows are read: a first read
+        finds the tags, the second one is rendered
+        """
+        context = self.get_page_context(subject_slug)
+        versions = get_tag_versions([*listing_tags(context['subject']), *course_tags(context['page'])])
+        context = self.get_page_context(subject_slug)
+        response = self.render_to_response(context)
+        response.render()
+        page = build_page(response.content)
+        # courses that appeared between the reads have no version taken
+        if course_tags(context['page']) <= versions.keys():
+            set_page(request, subject_slug, page, versions)
+        return page
+
+    def page_response(self, page):
+        response = HttpResponse(page['content'])
+        response['ETag'] = quote_etag(page['etag'])
+        response['Last-Modified'] = http_date(page['modified'].timestamp())
+        return response
+
+
+class CourseSearchView(TemplateResponseMixin, View):
+    template_name = 'courses/course/search.html'
+    paginate_by = 20
+
+    def get(self, request):
+        query = request.GET.get('q', '')
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        if page > MAX_SEARCH_PAGE:
+            raise Http404("No such page")
+        results, has_next = search_page(query, page, self.paginate_by, text_course_ids(request.user))
+        return self.render_to_response({
+            'query': query,
+            'results': results,
+            'page': page,
+            'has_next': has_next,
+            'previous_page': page - 1,
+            'next_page': page + 1,
+        })
 
 
+@method_decorator(catalog_condition(course_detail_validators), name='get')
 class CourseDetailView(DetailView):
     model = Course
     template_name = 'courses/course/detail.html'
+    replica_reads = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -139,8 +223,17 @@ class ModuleContentListView(TemplateResponseMixin, View):
     template_name = 'courses/manage/module/content_list.html'
 
     def get(self, request, module_id):
-        module = get_object_or_404(Module, id=module_id, course__owner=request.user)
-        return self.render_to_response({'module': module})
+        module = get_object_or_404(
+            Module.objects.select_related('course').prefetch_related(prefetch_contents()),
+            id=module_id, course__owner=request.user
+        )
+        # orders are sort keys with gaps, number the modules by position
+        modules = list(module.course.modules.all())
+        return self.render_to_response({
+            'module': module,
+            'modules': modules,
+            'position': modules.index(module) + 1
+        })
 
 
 class ContentDeleteView(View):
@@ -152,15 +245,79 @@ class ContentDeleteView(View):
         return redirect('courses:module_content_list', module.id)
 
 
-class ModuleOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
-    def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(id=id, course__owner=request.user).update(order=order)
-        return self.render_json_response({"saved": "OK"})
+class OrderMixin(CsrfExemptMixin, LoginRequiredMixin, JsonRequestResponseMixin):
+    """
+    Apply a ``{id: position}`` JSON body to the rows of ``model`` owned by
+    the user, through ``owner_field``, in one transaction and one bulk update
+    """
+    model = None
+    owner_field = 'owner'
 
+    def get_queryset(self):
+        return self.model._default_manager.filter(**{self.owner_field: self.request.user})
 
-class ContentOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
     def post(self, request):
-        for id, order in self.request_json.items():
-            Content.objects.filter(id=id, module__course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        if not isinstance(self.request_json, dict):
+            return self.render_bad_request_response({'errors': ['Expected an object of id: position']})
+        try:
+            updated = self.get_queryset().reorder(self.request_json)
+        except ValueError as exc:
+            return self.render_bad_request_response({'errors': [str(exc)]})
+        except ObjectDoesNotExist:
+            return self.render_json_response({'errors': ['Not found']}, status=404)
+        return self.render_json_response({'saved': 'OK', 'updated': updated})
+
+
+class ModuleOrderView(OrderMixin, View):
+    model = Module
+    owner_field = 'course__owner'
+
+
+class ContentOrderView(OrderMixin, View):
+    model = Content
+    owner_field = 'module__course__owner'
+
+
+def image_cache_control(item):
+    # private, access depends on the user
+    if content_storage.is_hashed_name(item.image.name):
+        # content addressed bytes, the response never changes
+        return 'private, max-age=31536000, immutable'
+    return 'private, max-age=86400'
+
+
+class ImageFileView(View):
+    """
+    Original file of an Image item, for its owner and the students enrolled
+    in a course that contains it
+    """
+    def get(self, request, pk):
+        item = get_object_or_404(Image, pk=pk)
+        if not EnrollmentService.can_view_item(request.user, item):
+            raise Http404("No image found matching the query")
+        if not item.image or not item.image.storage.exists(item.image.name):
+            raise Http404("No image found matching the query")
+        filename = (slugify(item.title) or 'image') + os.path.splitext(item.image.name)[1]
+        response = serve_file(request, item.image.name, filename, storage=item.image.storage, as_attachment=False)
+        response['Cache-Control'] = image_cache_control(item)
+        return response
+
+
+class ImageDerivativeView(View):
+    """
+    Resized copy of an Image item, generated on the first request and then
+    served from disk, for its owner and the students enrolled in a course
+    that contains it
+    """
+    def get(self, request, pk, width, extension):
+        item = get_object_or_404(Image, pk=pk)
+        if not EnrollmentService.can_view_item(request.user, item):
+            raise Http404("No image found matching the query")
+        if extension not in CONTENT_TYPES or not derivative_widths(item):
+            raise Http404("No such image derivative")
+        if width not in IMAGE_WIDTHS and width != item.width:
+            raise Http404("No such image derivative")
+        name = get_derivative(item, width, extension)
+        response = FileResponse(content_storage.open(name, 'rb'), content_type=CONTENT_TYPES[extension])
+        response['Cache-Control'] = image_cache_control(item)
+        return response
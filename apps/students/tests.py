@@ -1,3 +1,187 @@
-from django.test import TestCase
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..courses import outline
+from ..courses.api.authentication import make_token
+from ..courses import services
+from ..courses.cache import (
+    delete_enrollments, delete_outlines, enrollment_key, get_enrollment_version, set_enrollments
+)
+from ..courses.models import Subject, Course, Module, Content, File
+from ..courses.services import EnrollmentService
+from ..users.models import User
+
+
+class StudentFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner@example.com', 'secret', is_active=True)
+        cls.student = User.objects.create_user('student@example.com', 'secret', is_active=True)
+        cls.subject = Subject.objects.create(title='Mathematics', slug='mathematics')
+        cls.course = Course.objects.create(
+            owner=cls.owner, subject=cls.subject, title='Algebra', slug='algebra', overview='Groups'
+        )
+        cls.module = Module.objects.create(course=cls.course, title='Groups', description='')
+
+    def setUp(self):
+        cache.clear()
+
+    def api_headers(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {make_token(user)}'}
+
+
+class EnrollmentAccessTests(StudentFixtureMixin, TestCase):
+    def detail_status(self):
+        return self.client.get(reverse('students:student_course_detail', args=[self.course.pk])).status_code
+
+    def test_enroll_and_unenroll(self):
+        self.client.force_login(self.student)
+        self.assertEqual(self.detail_status(), 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('students:student_enroll_course'), {'course': self.course.pk})
+        self.assertRedirects(response, reverse('students:student_course_detail', args=[self.course.pk]))
+        self.assertEqual(self.detail_status(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('api:course-unenroll', args=[self.course.pk]), **self.api_headers(self.student)
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.detail_status(), 404)
+        response = self.client.get(
+            reverse('api:course-contents', args=[self.course.pk]), **self.api_headers(self.student)
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_enrollment_made_elsewhere_is_found(self):
+        self.assertFalse(EnrollmentService.is_enrolled(self.student, self.course.pk))
+        # added without the receivers refreshing the cached set
+        Course.students.through.objects.create(course=self.course, user=self.student)
+        self.assertTrue(EnrollmentService.is_enrolled(self.student, self.course.pk))
+
+    @override_settings(ENROLLMENT_VERIFY_AFTER=5)
+    def test_unenrollment_made_elsewhere_is_checked_again(self):
+        Course.students.through.objects.create(course=self.course, user=self.student)
+        self.assertTrue(EnrollmentService.is_enrolled(self.student, self.course.pk))
+        # removed by another process, leaving this process' cache as is
+        Course.students.through.objects.filter(user=self.student).delete()
+        self.assertTrue(EnrollmentService.is_enrolled(self.student, self.course.pk))
+        cache.set(enrollment_key(self.student.pk), (
+            time.time() - 10, [self.course.pk], get_enrollment_version(self.student.pk)
+        ))
+        self.assertFalse(EnrollmentService.is_enrolled(self.student, self.course.pk))
+        self.assertEqual(EnrollmentService.get_course_ids(self.student), [])
+
+    @override_settings(ENROLLMENT_VERIFY_AFTER=0)
+    def test_unenrollment_committed_while_reading(self):
+        Course.students.through.objects.create(course=self.course, user=self.student)
+        set_enrollments_ = services.set_enrollments
+
+        def racing(user_id, course_ids, version):
+            # the unenrollment commits once the set was read
+            Course.students.through.objects.filter(user_id=user_id).delete()
+            delete_enrollments([user_id])
+            set_enrollments_(user_id, course_ids, version)
+        with mock.patch.object(services, 'set_enrollments', racing):
+            self.assertTrue(EnrollmentService.is_enrolled(self.student, self.course.pk))
+        self.assertFalse(EnrollmentService.is_enrolled(self.student, self.course.pk))
+
+
+class CourseOutlineTests(StudentFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course.students.add(self.student)
+        self.client.force_login(self.student)
+
+    def urls(self, *args):
+        return [
+            reverse(f'students:student_course_detail{"_module" if args else ""}{suffix}', args=[self.course.pk, *args])
+            for suffix in ('', '_async')
+        ]
+
+    def test_outline_is_cached(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Groups')
+        with mock.patch.object(outline, 'build_course_outline') as build:
+            for url in self.urls(self.module.pk):
+                self.assertContains(self.client.get(url), 'Groups')
+        build.assert_not_called()
+
+    def test_module_changes_make_the_outline_stale(self):
+        self.client.get(self.urls()[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.module.title = 'Rings'
+            self.module.save()
+        for url in self.urls():
+            self.assertContains(self.client.get(url), 'Rings')
+        with self.captureOnCommitCallbacks(execute=True):
+            Module.objects.create(course=self.course, title='Fields', description='')
+        for url in self.urls():
+            self.assertContains(self.client.get(url), 'Fields')
+
+    def test_change_committed_while_reading(self):
+        build_course_outline = outline.build_course_outline
+
+        def racing(course_id):
+            course = build_course_outline(course_id)
+            # the rename commits once the outline was read
+            Module.objects.filter(pk=self.module.pk).update(title='Rings')
+            delete_outlines([course_id])
+            return course
+        with mock.patch.object(outline, 'build_course_outline', racing):
+            self.assertContains(self.client.get(self.urls()[0]), 'Groups')
+        self.assertContains(self.client.get(self.urls()[0]), 'Rings')
+
+    def test_unknown_modules_and_courses(self):
+        for url in self.urls(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        # enrollment cached for a course deleted since
+        set_enrollments(self.student.pk, [self.course.pk, 0], get_enrollment_version(self.student.pk))
+        for url in (reverse('students:student_course_detail', args=[0]),
+                    reverse('students:student_course_detail_async', args=[0])):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class FileDownloadTests(StudentFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(
+            MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory()), SENDFILE_BACKEND=''
+        ))
+        self.item = File.objects.create(
+            owner=self.owner, title='Lecture notes', file=SimpleUploadedFile('notes.txt', b'0123456789')
+        )
+        Content.objects.create(module=self.module, item=self.item)
+        self.url = reverse('students:file_download', args=[self.item.pk])
+
+    def test_anonymous_users_are_sent_to_login(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_unenrolled_users_get_404(self):
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_owner_and_enrolled_students_download(self):
+        self.course.students.add(self.student)
+        for user in (self.owner, self.student):
+            self.client.force_login(user)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('filename="lecture-notes.txt"', response['Content-Disposition'])
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_range_and_conditional_requests(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
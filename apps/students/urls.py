@@ -1,6 +1,9 @@
 from django.urls import path
 
-from .views import RegistrationView, StudentEnrollCourseView, StudentCourseListView, StudentCourseDetailView
+from .views import (
+    RegistrationView, StudentEnrollCourseView, StudentCourseListView, StudentCourseDetailView,
+    StudentCourseDetailAsyncView, StudentFileDownloadView
+)
 
 app_name = "students"
 
@@ -30,4 +33,19 @@ urlpatterns = [
         StudentCourseDetailView.as_view(),
         name='student_course_detail_module'
     ),
+    path(
+        'file/<int:pk>/download/',
+        StudentFileDownloadView.as_view(),
+        name='file_download'
+    ),
+    path(
+        'async/course/<pk>/',
+        StudentCourseDetailAsyncView.as_view(),
+        name='student_course_detail_async'
+    ),
+    path(
+        'async/course/<pk>/<module_id>/',
+        StudentCourseDetailAsyncView.as_view(),
+        name='student_course_detail_module_async'
+    ),
 ]
@@ -1,3 +1,10 @@
+import os
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import get_object_or_404, render
+from django.utils.text import slugify
+from django.views import View
 from django.urls import reverse_lazy
 from django.views.generic.edit import CreateView, FormView
 from django.views.generic.list import ListView
@@ -6,7 +13,10 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from .forms import CourseEnrollForm, RegistrationForm
 from django.contrib.auth import authenticate, login
 
-from ..courses.models import Course
+from ..courses.downloads import serve_file
+from ..courses.models import Course, File
+from ..courses.outline import get_course_outline, aget_course_outline, select_module, load_contents
+from ..courses.services import EnrollmentService
 
 
 class RegistrationView(CreateView):
@@ -28,7 +38,7 @@ class StudentEnrollCourseView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         self.course = form.cleaned_data['course']
-        self.course.students.add(self.request.user)
+        EnrollmentService.enroll(self.request.user, self.course)
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -41,27 +51,71 @@ class StudentCourseListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        return qs.filter(id__in=EnrollmentService.get_course_ids(self.request.user))
 
 
 class StudentCourseDetailView(DetailView):
     model = Course
     template_name = "students/course/detail.html"
 
-    def get_queryset(self):
-        qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+    def get_object(self, queryset=None):
+        if not EnrollmentService.is_enrolled(self.request.user, self.kwargs['pk']):
+            raise Http404("No course found matching the query")
+        # the course and its modules, from the cache
+        course = get_course_outline(self.kwargs['pk'])
+        if course is None:
+            raise Http404("No course found matching the query")
+        return course
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # get course object
-        course = self.get_object()
-        if 'module_id' in self.kwargs:
-            # get current module
-            context['module'] = course.modules.get(
-                id=self.kwargs['module_id']
-            )
-        else:
-            # get first module
-            context['module'] = course.modules.all()[0]
+        # current module, the first one by default
+        module = select_module(self.object, self.kwargs.get('module_id'))
+        if module is None and 'module_id' in self.kwargs:
+            raise Http404("No module found matching the query")
+        if module is not None:
+            load_contents(module)
+        context['module'] = module
         return context
+
+
+class StudentCourseDetailAsyncView(View):
+    """
+    Async StudentCourseDetailView, every query is made before rendering
+    so that the template does not touch the database
+    """
+    template_name = "students/course/detail.html"
+
+    async def get(self, request, pk, module_id=None):
+        # load the session user outside of the event loop
+        await sync_to_async(lambda: request.user.is_authenticated)()
+        if not await EnrollmentService.ais_enrolled(request.user, pk):
+            raise Http404("No course found matching the query")
+        course = await aget_course_outline(pk)
+        if course is None:
+            raise Http404("No course found matching the query")
+        module = select_module(course, module_id)
+        if module is None and module_id is not None:
+            raise Http404("No module found matching the query")
+        if module is not None:
+            await sync_to_async(load_contents)(module)
+        return render(request, self.template_name, {
+            'object': course, 'course': course, 'module': module, 'view': self
+        })
+
+
+class StudentFileDownloadView(LoginRequiredMixin, View):
+    """
+    Download of a File item, for its owner and the students enrolled in a
+    course that contains it
+    """
+    def get(self, request, pk):
+        item = get_object_or_404(File, pk=pk)
+        if not EnrollmentService.can_view_item(request.user, item):
+            raise Http404("No file found matching the query")
+        if not item.file or not item.file.storage.exists(item.file.name):
+            raise Http404("No file found matching the query")
+        # stored names are content hashes, download under the item title
+        extension = os.path.splitext(item.file.name)[1]
+        filename = (slugify(item.title) or 'file') + extension
+        return serve_file(request, item.file.name, filename, storage=item.file.storage)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User
+from .models import User, OutboxEmail
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .forms import UserAdminCreationForm, UserAdminChangeForm
 
@@ -38,3 +38,11 @@ class UserAdmin(BaseUserAdmin):
 
 
 admin.site.register(User, UserAdmin)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ["subject", "recipient", "status", "attempts", "next_attempt_at", "sent_at"]
+    list_filter = ["status"]
+    search_fields = ["recipient"]
+    readonly_fields = ["created", "sent_at", "last_error"]
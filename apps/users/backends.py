@@ -0,0 +1,78 @@
+"""
+ModelBackend keeping the permission set of each user in the shared cache.
+
+Cache keys embed a global version, bumped when the permissions of a group
+or the permissions themselves change, a version of the user, bumped when
+the groups or permissions of the user change, see apps.users.signals, and
+the superuser flag of the user. Versions are read before the permissions,
+so a set read from the database before a change is cached under versions
+that the change made stale.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from learnXpert.metrics import record_cache
+
+VERSION_KEY = 'permissions:version'
+
+
+def user_version_key(user_id):
+    return f'permissions:user:{user_id}:version'
+
+
+def get_versions(user_id):
+    """
+    The global version and the version of the user
+    """
+    keys = [VERSION_KEY, user_version_key(user_id)]
+    versions = cache.get_many(keys)
+    if len(versions) < len(keys):
+        # started from the clock, so that entries cached under versions
+        # used before an eviction of the key are not read again
+        for key in keys:
+            if key not in versions:
+                cache.add(key, time.time_ns() // 1000, None)
+        versions = cache.get_many(keys)
+    return versions.get(keys[0]), versions.get(keys[1])
+
+
+def permissions_key(user, versions):
+    return 'permissions:{}:{}:{}:{}'.format(*versions, user.pk, int(user.is_superuser))
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # missing, the next get_versions() starts a new one
+        pass
+
+
+def delete_user_permissions(user_ids):
+    """
+    Make the cached permissions of some users stale
+    """
+    for user_id in user_ids:
+        _bump(user_version_key(user_id))
+
+
+def delete_all_permissions():
+    _bump(VERSION_KEY)
+
+
+class CachedPermissionsBackend(ModelBackend):
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_key(user_obj, get_versions(user_obj.pk))
+            permissions = cache.get(key)
+            record_cache('permissions', permissions is not None)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, settings.PERMISSION_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
@@ -0,0 +1,33 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from ...services import OutboxService
+
+
+class Command(BaseCommand):
+    help = "Send the queued emails of the outbox over a single mail connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Emails claimed and sent at a time")
+        parser.add_argument('--max-attempts', type=int, help="Attempts before an email is marked as failed")
+        parser.add_argument('--backend', help="Email backend to send with instead of EMAIL_BACKEND")
+        parser.add_argument('--loop', action='store_true', help="Keep draining the outbox")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between two drains with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            stats = OutboxService.drain(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+                connection=get_connection(options['backend'], fail_silently=False),
+            )
+            if stats['sent'] or stats['retried'] or stats['failed'] or not options['loop']:
+                self.stdout.write(
+                    "sent={sent} retried={retried} failed={failed} pending={pending} "
+                    "batches={batches} seconds={seconds}".format(**stats)
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
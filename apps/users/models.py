@@ -1,4 +1,6 @@
+from django.core.mail import EmailMessage
 from django.db import models
+from django.utils import timezone
 from .manager import CustomUser
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 
@@ -33,3 +35,46 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
+
+
+class OutboxEmail(models.Model):
+    """
+    Email waiting to be delivered by the drain_outbox worker
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    recipient = models.EmailField(verbose_name="Recipient")
+    subject = models.CharField(max_length=255, verbose_name="Subject")
+    body = models.TextField(verbose_name="Body")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Status")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Attempts")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Next attempt at",
+        help_text="The email is not sent before this time"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Last error")
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Sent at")
+
+    class Meta:
+        verbose_name = "Outbox email"
+        verbose_name_plural = "Outbox emails"
+        db_table = "outbox_emails"
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"])
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipient}"
+
+    def as_message(self, connection):
+        return EmailMessage(self.subject, self.body, to=[self.recipient], connection=connection)
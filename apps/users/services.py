@@ -1,12 +1,45 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import login
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import EmailMessage
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Count
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from learnXpert.metrics import REGISTRY
+
+from ..users.models import User, OutboxEmail
+
+logger = logging.getLogger(__name__)
+
 
-from ..users.models import User
+def outbox_sizes():
+    return {
+        (row['status'],): row['count']
+        for row in OutboxEmail.objects.values('status').annotate(count=Count('id')).order_by()
+    }
+
+
+OUTBOX_EMAILS = REGISTRY.gauge(
+    'outbox_emails', 'Emails of the outbox by status', outbox_sizes, ('status',)
+)
+OUTBOX_ATTEMPTS = REGISTRY.counter(
+    'outbox_send_attempts_total', 'Outbox send attempts by result', ('result',)
+)
+OUTBOX_RETRY_DELAY = REGISTRY.histogram(
+    'outbox_retry_delay_seconds', 'Backoff before the next attempt of a failed outbox email', (),
+    (60, 120, 300, 600, 1800, 3600, 7200, 14400, 43200, 86400)
+)
+OUTBOX_DRAIN_DURATION = REGISTRY.histogram(
+    'outbox_drain_duration_seconds', 'Time spent draining the outbox', (), (0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
 
 
 class TokenGenerator(PasswordResetTokenGenerator):
@@ -21,36 +54,34 @@ class UserService:
     @staticmethod
     def create_user(request, form):
         try:
-            user = form.save(commit=False)
-            user.is_active = False
-            user.save()
-            # send email to user
-            sent = UserService.send_email(request, user)
-            return sent
-        except Exception as e:
-            print(e)
+            with transaction.atomic():
+                user = form.save(commit=False)
+                user.is_active = False
+                user.save()
+                # queue the activation email with the user, drain_outbox sends it
+                UserService.send_email(request, user)
+            return True
+        except Exception:
+            logger.exception("Signing up %s failed", form.cleaned_data.get('email'))
             return False
 
     @staticmethod
     def send_email(request, user):
-        # send email to user
-        try:
-            current_site = get_current_site(request)
-            subject = "Activate Your LearnXpert Account"
-            message = render_to_string(
-                "users/activate_account.html",
-                {
-                    "user": user,
-                    "domain": current_site.domain,
-                    "uid": urlsafe_base64_encode(force_bytes(user.pk)),
-                    "token": account_activation_token.make_token(user),
-                }
-            )
-            EmailMessage(subject, message, to=[user.email]).send(fail_silently=False)
-            return True
-        except Exception as e:
-            print(e)
-            return False
+        """
+        Queue the activation email of a user in the outbox
+        """
+        current_site = get_current_site(request)
+        subject = "Activate Your LearnXpert Account"
+        message = render_to_string(
+            "users/activate_account.html",
+            {
+                "user": user,
+                "domain": current_site.domain,
+                "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+                "token": account_activation_token.make_token(user),
+            }
+        )
+        return OutboxService.enqueue(user.email, subject, message)
 
     @staticmethod
     def get_token_owner(uidb64):
@@ -69,6 +100,101 @@ class UserService:
             user.save()
             login(request, user)
             return True
-        except Exception as e:
-            print(e)
+        except Exception:
+            logger.exception("Activating user %s failed", user.pk)
             return False
+
+
+class OutboxService:
+    @staticmethod
+    def enqueue(recipient, subject, body):
+        return OutboxEmail.objects.create(recipient=recipient, subject=subject, body=body)
+
+    @staticmethod
+    def retry_delay(attempts):
+        """
+        Exponential backoff after the given number of failed attempts
+        """
+        return timedelta(seconds=settings.OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+    @staticmethod
+    def claim(batch_size):
+        """
+        Mark a batch of due emails as being sent and commit, so that no row
+        stays locked while talking to the mail server. A claim expires after
+        OUTBOX_CLAIM_TIMEOUT, the emails of a worker that died are sent again.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+                    status__in=(OutboxEmail.PENDING, OutboxEmail.SENDING), next_attempt_at__lte=now
+                ).order_by('next_attempt_at', 'id')[:batch_size]
+            )
+            for email in batch:
+                email.status = OutboxEmail.SENDING
+                email.next_attempt_at = now + timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+            OutboxEmail.objects.bulk_update(batch, ['status', 'next_attempt_at'])
+        return batch
+
+    @staticmethod
+    def drain(batch_size=None, max_attempts=None, connection=None):
+        """
+        Send every due email of the outbox over a single mail connection, a
+        batch at a time, and return the counts of sent, retried and failed
+        emails. Batches are claimed with SKIP LOCKED so that several workers
+        can drain the outbox at the same time.
+        """
+        batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        connection = connection or get_connection(fail_silently=False)
+        stats = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+        start = time.monotonic()
+        with connection:
+            while True:
+                batch = OutboxService.claim(batch_size)
+                if not batch:
+                    break
+                for email in batch:
+                    OutboxService._send(email, connection, max_attempts, stats)
+                OutboxEmail.objects.bulk_update(
+                    batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+                )
+                stats['batches'] += 1
+        stats['seconds'] = round(time.monotonic() - start, 3)
+        OUTBOX_DRAIN_DURATION.observe((), stats['seconds'])
+        stats['pending'] = OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count()
+        logger.info("Outbox drained: %s", stats)
+        return stats
+
+    @staticmethod
+    def _send(email, connection, max_attempts, stats):
+        email.attempts += 1
+        try:
+            connection.send_messages([email.as_message(connection)])
+        except Exception as e:
+            logger.warning("Sending outbox email %s failed: %r", email.pk, e)
+            # the connection may be broken, the next emails are sent over a new one
+            try:
+                connection.close()
+                connection.open()
+            except Exception:
+                logger.exception("Reopening the mail connection failed")
+            email.last_error = repr(e)
+            if email.attempts >= max_attempts:
+                email.status = OutboxEmail.FAILED
+                stats['failed'] += 1
+                OUTBOX_ATTEMPTS.inc(('failed',))
+            else:
+                delay = OutboxService.retry_delay(email.attempts)
+                email.status = OutboxEmail.PENDING
+                email.next_attempt_at = timezone.now() + delay
+                stats['retried'] += 1
+                OUTBOX_ATTEMPTS.inc(('retried',))
+                OUTBOX_RETRY_DELAY.observe((), delay.total_seconds())
+        else:
+            email.status = OutboxEmail.SENT
+            email.sent_at = timezone.now()
+            email.last_error = ''
+            stats['sent'] += 1
+            OUTBOX_ATTEMPTS.inc(('sent',))
@@ -0,0 +1,42 @@
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete
+
+from .backends import delete_all_permissions, delete_user_permissions
+from .models import User
+
+
+def user_permissions_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """
+    Make the cached permissions of the users whose groups or permissions
+    changed stale, user.groups / user.user_permissions or the reverse relations
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        # the users are not listed for clear()
+        transaction.on_commit(delete_all_permissions, using=using)
+        return
+    else:
+        user_ids = list(pk_set)
+    transaction.on_commit(lambda: delete_user_permissions(user_ids), using=using)
+
+
+def group_permissions_changed(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(delete_all_permissions, using=using)
+
+
+def permissions_deleted(sender, using, **kwargs):
+    transaction.on_commit(delete_all_permissions, using=using)
+
+
+m2m_changed.connect(user_permissions_changed, sender=User.groups.through, dispatch_uid='user_groups_changed')
+m2m_changed.connect(
+    user_permissions_changed, sender=User.user_permissions.through, dispatch_uid='user_permissions_changed'
+)
+m2m_changed.connect(group_permissions_changed, sender=Group.permissions.through, dispatch_uid='group_permissions_changed')
+post_delete.connect(permissions_deleted, sender=Group, dispatch_uid='group_deleted')
+post_delete.connect(permissions_deleted, sender=Permission, dispatch_uid='permission_deleted')
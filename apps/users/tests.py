@@ -0,0 +1,178 @@
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from learnXpert.metrics import REGISTRY
+
+from .backends import delete_user_permissions
+from .models import OutboxEmail, User
+from .services import OutboxService
+
+
+class FlakyBackend(locmem.EmailBackend):
+    """
+    Locmem backend refusing the emails to the ``failing`` recipients and
+    counting the connections it opens
+    """
+    def __init__(self, failing=(), **kwargs):
+        super().__init__(**kwargs)
+        self.failing = set(failing)
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.failing.intersection(message.to):
+                raise SMTPException(f'{message.to[0]} refused')
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', OUTBOX_RETRY_BACKOFF=60, OUTBOX_MAX_ATTEMPTS=3
+)
+class OutboxTests(TestCase):
+    def enqueue(self, recipient='student@example.com'):
+        return OutboxService.enqueue(recipient, 'Subject', 'Body')
+
+    def drain_failing(self, connection):
+        with self.assertLogs('apps.users.services', 'WARNING'):
+            return OutboxService.drain(connection=connection)
+
+    def make_due(self):
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_signup_queues_the_activation_email(self):
+        response = self.client.post(reverse('users:signup'), {
+            'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com',
+            'password1': 'a-long-secret-1', 'password2': 'a-long-secret-1',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.recipient, email.status), ('ada@example.com', OutboxEmail.PENDING))
+        self.assertIn('/activate/', email.body)
+        OutboxService.drain()
+        self.assertEqual([message.to for message in mail.outbox], [['ada@example.com']])
+
+    def test_drain_sends_the_batches_over_one_connection(self):
+        for index in range(5):
+            self.enqueue(f'student{index}@example.com')
+        connection = FlakyBackend()
+        stats = OutboxService.drain(batch_size=2, connection=connection)
+        self.assertEqual((stats['sent'], stats['batches'], stats['pending']), (5, 3, 0))
+        self.assertEqual(connection.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+
+    def test_failed_sends_are_retried_with_backoff(self):
+        failing, other = self.enqueue('failing@example.com'), self.enqueue()
+        connection = FlakyBackend(failing=['failing@example.com'])
+        stats = self.drain_failing(connection)
+        self.assertEqual((stats['sent'], stats['retried'], stats['pending']), (1, 1, 1))
+        # the connection is opened again after the failure
+        self.assertEqual(connection.opened, 2)
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIn('failing@example.com refused', failing.last_error)
+        delay = failing.next_attempt_at - timezone.now()
+        self.assertTrue(timedelta(seconds=55) < delay <= timedelta(seconds=60))
+        # not due yet
+        self.assertEqual(OutboxService.drain(connection=FlakyBackend())['sent'], 0)
+        self.make_due()
+        self.drain_failing(FlakyBackend(failing=['failing@example.com']))
+        failing.refresh_from_db()
+        delay = failing.next_attempt_at - timezone.now()
+        self.assertTrue(timedelta(seconds=115) < delay <= timedelta(seconds=120))
+        self.assertEqual(OutboxEmail.objects.get(pk=other.pk).attempts, 1)
+
+    def test_emails_fail_after_the_last_attempt(self):
+        email = self.enqueue('failing@example.com')
+        for _ in range(3):
+            self.make_due()
+            stats = self.drain_failing(FlakyBackend(failing=['failing@example.com']))
+        self.assertEqual((stats['retried'], stats['failed']), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.FAILED, 3))
+        self.make_due()
+        self.assertEqual(OutboxService.drain(connection=FlakyBackend())['sent'], 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_claims_of_dead_workers_expire(self):
+        claimed, expired = self.enqueue('claimed@example.com'), self.enqueue('expired@example.com')
+        OutboxEmail.objects.update(status=OutboxEmail.SENDING, next_attempt_at=timezone.now() + timedelta(minutes=5))
+        OutboxEmail.objects.filter(pk=expired.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(OutboxService.drain()['sent'], 1)
+        self.assertEqual([message.to for message in mail.outbox], [['expired@example.com']])
+        self.assertEqual(OutboxEmail.objects.get(pk=claimed.pk).status, OutboxEmail.SENDING)
+
+    def test_metrics(self):
+        self.enqueue('failing@example.com')
+        self.enqueue()
+        self.drain_failing(FlakyBackend(failing=['failing@example.com']))
+        metrics = REGISTRY.render()
+        self.assertIn('outbox_send_attempts_total{result="retried"}', metrics)
+        self.assertIn('outbox_retry_delay_seconds_count', metrics)
+        self.assertIn('outbox_emails{status="pending"} 1', metrics)
+        self.assertIn('outbox_emails{status="sent"} 1', metrics)
+
+
+class PermissionCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner@example.com', 'secret', is_active=True)
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(name='Instructors')
+        self.permission = Permission.objects.get(codename='add_course')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.permission)
+            self.owner.groups.add(self.group)
+
+    def has_perm(self):
+        # a new instance, as loaded by every request
+        return User.objects.get(pk=self.owner.pk).has_perm('courses.add_course')
+
+    def test_permissions_are_cached(self):
+        self.assertTrue(self.has_perm())
+        with self.assertNumQueries(1):
+            self.assertTrue(self.has_perm())
+
+    def test_group_membership_changes(self):
+        self.assertTrue(self.has_perm())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.groups.remove(self.group)
+        self.assertFalse(self.has_perm())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.add(self.owner)
+        self.assertTrue(self.has_perm())
+
+    def test_group_permission_changes(self):
+        self.assertTrue(self.has_perm())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.remove(self.permission)
+        self.assertFalse(self.has_perm())
+
+    def test_change_committed_while_reading(self):
+        get_all_permissions = ModelBackend.get_all_permissions
+
+        def racing(backend, user_obj, obj=None):
+            permissions = get_all_permissions(backend, user_obj, obj)
+            # the user leaves the group before the set read is cached
+            User.groups.through.objects.filter(user_id=user_obj.pk).delete()
+            delete_user_permissions([user_obj.pk])
+            return permissions
+        with mock.patch.object(ModelBackend, 'get_all_permissions', racing):
+            self.assertTrue(self.has_perm())
+        self.assertFalse(self.has_perm())
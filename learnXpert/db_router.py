@@ -0,0 +1,161 @@
+"""
+Read replica routing.
+
+Writes, and reads by default, go to the ``default`` database. Views with a
+true ``replica_reads`` attribute read from one of REPLICA_DATABASES on safe
+methods, unless the user wrote recently: a request that writes sets a cookie
+keeping the reads of the user on the primary for REPLICA_STICKY_SECONDS, so
+that users see their own writes whatever the replication lag.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .metrics import REGISTRY
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# sessions, users and permissions are always read from the primary, a
+# session missing from a lagging replica would log its user out
+PRIMARY_APPS = {'sessions', 'auth', 'users'}
+
+_current = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        self.replica = False
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects come from the database of the instance
+            return instance._state.db
+        state = _current.get()
+        if (state is not None and state.replica and settings.REPLICA_DATABASES
+                and model._meta.app_label not in PRIMARY_APPS):
+            return random.choice(settings.REPLICA_DATABASES)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary within the block, e.g. to build data that is
+    stored or cached for every user
+    """
+    state = _current.get()
+    if state is None or not state.replica:
+        yield
+        return
+    state.replica = False
+    try:
+        yield
+    finally:
+        state.replica = True
+
+
+def view_replica_reads(view_func):
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    return getattr(view_func, 'replica_reads', False) or getattr(view_class, 'replica_reads', False)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the reads of the views allowing it to the replicas, to be placed
+    before SessionMiddleware so that session writes count as writes
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _current.get()
+        if state is None or not settings.REPLICA_DATABASES:
+            return None
+        sticky_until = request.COOKIES.get(settings.REPLICA_STICKY_COOKIE, '')
+        sticky = sticky_until.isdigit() and int(sticky_until) > time.time()
+        state.replica = request.method in SAFE_METHODS and not sticky and view_replica_reads(view_func)
+        return None
+
+    def _finish(self, response, state, token):
+        _current.reset(token)
+        if state.wrote and settings.REPLICA_DATABASES:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, str(int(time.time() + seconds)), max_age=seconds,
+                httponly=True, samesite='Lax'
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _current.set(state)
+        response = self.get_response(request)
+        return self._finish(response, state, token)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _current.set(state)
+        response = await self.get_response(request)
+        return self._finish(response, state, token)
+
+
+LAG_QUERIES = {
+    'postgresql': (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    ),
+}
+
+
+def replica_lag():
+    """
+    Replication delay in seconds of each replica, None when the backend
+    does not report it, e.g. SQLite files standing in for replicas
+    """
+    lags = {}
+    for alias in settings.REPLICA_DATABASES:
+        query = LAG_QUERIES.get(connections[alias].vendor)
+        lag = None
+        if query:
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(query)
+                    lag = cursor.fetchone()[0]
+            except DatabaseError:
+                lag = None
+        lags[(alias,)] = None if lag is None else float(lag)
+    return lags
+
+
+REPLICA_LAG = REGISTRY.gauge(
+    'db_replica_lag_seconds', 'Replication delay of the read replicas', replica_lag, ('database',)
+)
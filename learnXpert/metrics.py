@@ -0,0 +1,325 @@
+"""
+Per-request performance instrumentation.
+
+MetricsMiddleware records for every request the number and time of the SQL
+queries, how many of them repeated a statement already run (N+1 patterns),
+the time spent rendering templates and the cache hits and misses. It reports
+them in a Server-Timing header, to staff users or everyone with
+SERVER_TIMING, and aggregates them per route into the histograms served in
+the Prometheus text format by ``metrics_view``.
+
+The registry lives in the process, each worker exposes its own series.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils.crypto import constant_time_compare
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = _labels(self.label_names, labels, f'le="{bucket}"')
+                yield f'{self.name}_bucket{le} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {total}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {count}'
+
+
+class CounterMetric:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = Counter()
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] += amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.label_names, labels)} {value}'
+
+
+class Gauge:
+    """
+    Gauge read from ``callback`` at scrape time, which returns a number or
+    a ``{labels tuple: number}`` dict
+    """
+    def __init__(self, name, help_text, label_names, callback):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.callback = callback
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} gauge'
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                yield f'{self.name}{_labels(self.label_names, labels)} {value}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help_text, label_names=(), buckets=DURATION_BUCKETS):
+        return self._add(Histogram(name, help_text, label_names, buckets))
+
+    def counter(self, name, help_text, label_names=()):
+        return self._add(CounterMetric(name, help_text, label_names))
+
+    def gauge(self, name, help_text, callback, label_names=()):
+        """
+        Register a gauge computed on every scrape, e.g. a queue length
+        """
+        return self._add(Gauge(name, help_text, label_names, callback))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time spent handling requests', ('route', 'method')
+)
+DB_QUERIES = REGISTRY.histogram(
+    'http_request_db_queries', 'SQL queries per request', ('route', 'method'), QUERY_BUCKETS
+)
+DB_DUPLICATE_QUERIES = REGISTRY.histogram(
+    'http_request_db_duplicate_queries', 'SQL statements repeated within a request',
+    ('route', 'method'), QUERY_BUCKETS
+)
+DB_DURATION = REGISTRY.histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL queries per request', ('route', 'method')
+)
+TEMPLATE_DURATION = REGISTRY.histogram(
+    'http_request_template_duration_seconds', 'Time spent rendering templates per request',
+    ('route', 'method')
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result')
+)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'query_time', 'statements', 'template_time', 'template_depth', 'cache_hits',
+                 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def duplicate_queries(self):
+        return self.queries - len(self.statements)
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries, '
+            f'{self.duplicate_queries} repeated", '
+            f'tpl;dur={self.template_time * 1000:.1f}, '
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses", '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper of every database connection, recording into the
+    metrics of the current request if any
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.query_time += time.perf_counter() - start
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid='metrics_query_recorder')
+
+
+def record_cache(cache_name, hit):
+    """
+    Count a lookup of one of the application caches
+    """
+    CACHE_REQUESTS.inc((cache_name, 'hit' if hit else 'miss'))
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # templates rendered while rendering another one are counted once
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend timing the templates it renders
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class MetricsMiddleware:
+    """
+    Collect the metrics of each request, to be placed first in MIDDLEWARE
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        # connections opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def _finish(self, request, response, metrics, token, start):
+        total = time.perf_counter() - start
+        _current.reset(token)
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unmatched', request.method)
+        REQUEST_DURATION.observe(labels, total)
+        DB_QUERIES.observe(labels, metrics.queries)
+        DB_DUPLICATE_QUERIES.observe(labels, metrics.duplicate_queries)
+        DB_DURATION.observe(labels, metrics.query_time)
+        TEMPLATE_DURATION.observe(labels, metrics.template_time)
+        if settings.SERVER_TIMING or getattr(getattr(request, 'user', None), 'is_staff', False):
+            response['Server-Timing'] = metrics.server_timing(total)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, start = self._start()
+        response = self.get_response(request)
+        return self._finish(request, response, metrics, token, start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self._start()
+        response = await self.get_response(request)
+        return self._finish(request, response, metrics, token, start)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, for a bearer METRICS_TOKEN when configured
+    and for staff users otherwise
+    """
+    if settings.METRICS_TOKEN:
+        allowed = constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {settings.METRICS_TOKEN}'
+        )
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -15,6 +15,9 @@ DEBUG = config('DEBUG', default=False, cast=bool)
 ALLOWED_HOSTS = []
 
 AUTH_USER_MODEL = 'users.User'
+# permission sets cached per user, see apps.users.backends
+AUTHENTICATION_BACKENDS = ['apps.users.backends.CachedPermissionsBackend']
+PERMISSION_CACHE_TIMEOUT = config("PERMISSION_CACHE_TIMEOUT", default=60 * 60, cast=int)
 # Application definition
 
 CUSTOM_APPS = [
@@ -46,6 +49,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'learnXpert.metrics.MetricsMiddleware',
+    'learnXpert.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +64,8 @@ ROOT_URLCONF = 'learnXpert.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates timing the rendering for the request metrics
+        'BACKEND': 'learnXpert.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -120,5 +126,86 @@ EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 EMAIL_USE_TLS = config("EMAIL_USE_TLS", cast=bool)
 EMAIL_USE_SSL = config("EMAIL_USE_SSL", cast=bool)
+# directory of the file based email backend
+EMAIL_FILE_PATH = config("EMAIL_FILE_PATH", default=str(BASE_DIR / 'sent_emails'))
+# emails sent per transaction by drain_outbox
+OUTBOX_BATCH_SIZE = config("OUTBOX_BATCH_SIZE", default=100, cast=int)
+# attempts before an outbox email is marked as failed
+OUTBOX_MAX_ATTEMPTS = config("OUTBOX_MAX_ATTEMPTS", default=5, cast=int)
+# seconds before the first retry, doubled after every failed attempt
+OUTBOX_RETRY_BACKOFF = config("OUTBOX_RETRY_BACKOFF", default=60, cast=int)
+# seconds a drain_outbox worker has to send a claimed batch, before another
+# worker takes it over
+OUTBOX_CLAIM_TIMEOUT = config("OUTBOX_CLAIM_TIMEOUT", default=600, cast=int)
+
+# FILE DOWNLOADS
+# '' serves protected files from Django, 'nginx' hands them to the proxy
+# with X-Accel-Redirect, 'xsendfile' (Apache, lighttpd) with X-Sendfile
+SENDFILE_BACKEND = config("SENDFILE_BACKEND", default="")
+# internal nginx location aliased to MEDIA_ROOT, used with X-Accel-Redirect
+SENDFILE_URL_PREFIX = config("SENDFILE_URL_PREFIX", default="/protected/")
+
+# COURSE ARCHIVES
+# limits of the archives imported through the API, checked on the zip
+# directory before anything is stored: entries, bytes once uncompressed,
+# and bytes of the manifest and of each line of the contents
+ARCHIVE_MAX_ENTRIES = config("ARCHIVE_MAX_ENTRIES", default=10000, cast=int)
+ARCHIVE_MAX_SIZE = config("ARCHIVE_MAX_SIZE", default=1024 ** 3, cast=int)
+ARCHIVE_MAX_RECORD_SIZE = config("ARCHIVE_MAX_RECORD_SIZE", default=1024 ** 2, cast=int)
+
+# CACHE SETTINGS
+MEMCACHED_LOCATION = config("MEMCACHED_LOCATION", default="")
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION,
+        }
+    }
+else:
+    # in-process LRU fallback
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'learnxpert',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# seconds a rendered content item is kept in the cache
+RENDER_CACHE_TIMEOUT = config("RENDER_CACHE_TIMEOUT", default=60 * 60 * 24, cast=int)
+# seconds the set of courses a student is enrolled in is kept in the cache,
+# shorter in the in-process fallback, which the other processes do not update
+ENROLLMENT_CACHE_TIMEOUT = config(
+    "ENROLLMENT_CACHE_TIMEOUT", default=60 * 60 * 24 if MEMCACHED_LOCATION else 60 * 5, cast=int
+)
+# seconds after which a cached enrollment granting access is checked again
+# against the database, 0 to trust it until it expires. Unenrollments only
+# reach the in-process fallback of the process making them.
+ENROLLMENT_VERIFY_AFTER = config("ENROLLMENT_VERIFY_AFTER", default=0 if MEMCACHED_LOCATION else 5, cast=int)
+# seconds the outline of a course, i.e. the course and its modules, is kept in the cache
+OUTLINE_CACHE_TIMEOUT = config("OUTLINE_CACHE_TIMEOUT", default=60 * 60, cast=int)
+
+# seconds front caches may keep catalog pages served to anonymous users
+CATALOG_CACHE_MAX_AGE = config("CATALOG_CACHE_MAX_AGE", default=60, cast=int)
+# seconds a catalog page rendered for anonymous users is kept in the cache
+CATALOG_PAGE_CACHE_TIMEOUT = config("CATALOG_PAGE_CACHE_TIMEOUT", default=60 * 10, cast=int)
+# seconds a token of /api/token/ is valid
+API_TOKEN_MAX_AGE = config("API_TOKEN_MAX_AGE", default=60 * 60 * 24, cast=int)
+# seconds verified Basic credentials of the API are kept in the cache
+BASIC_AUTH_CACHE_TIMEOUT = config("BASIC_AUTH_CACHE_TIMEOUT", default=60 * 5, cast=int)
+
+DATABASE_ROUTERS = ['learnXpert.db_router.ReplicaRouter']
+# aliases of the read replicas in DATABASES, see settings.development
+REPLICA_DATABASES = []
+# seconds the reads of a user stay on the primary database after a write
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=10, cast=int)
+REPLICA_STICKY_COOKIE = "primary_reads_until"
+
+# bearer token of the Prometheus /metrics endpoint, staff users only when empty
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+# whether every response reports its query, template and cache timings in a
+# Server-Timing header, otherwise only the responses to staff users do
+SERVER_TIMING = config("SERVER_TIMING", default=DEBUG, cast=bool)
 
 LOGIN_REDIRECT_URL = reverse_lazy('students:student_course_list')
\ No newline at end of file
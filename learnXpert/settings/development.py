@@ -1,3 +1,5 @@
+from decouple import Csv
+
 from .common import *
 
 
@@ -11,3 +13,15 @@ DATABASES = {
         'PORT': config("DATABASE_PORT"),
     }
 }
+
+# read replicas sharing the settings of the primary: comma separated hosts,
+# or database files with SQLite, e.g. DATABASE_REPLICAS=/tmp/replica.sqlite3
+# to try the routing locally. Tests run against the primary only.
+for index, location in enumerate(config("DATABASE_REPLICAS", default="", cast=Csv())):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME' if 'sqlite3' in DATABASES['default']['ENGINE'] else 'HOST': location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
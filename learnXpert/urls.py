@@ -4,6 +4,8 @@ from django.conf.urls.static import static
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("login/", auth_views.LoginView.as_view(template_name='users/login.html'), name="login"),
@@ -12,6 +14,7 @@ urlpatterns = [
     path("students/", include('apps.students.urls', namespace='students')),
     path("", include('apps.courses.urls', namespace='courses')),
     path('api/', include('apps.courses.api.urls', namespace='api')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)